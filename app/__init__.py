@@ -1,12 +1,33 @@
+import hashlib
+import mimetypes
 import os
 
-from flask import Flask
+from flask import Flask, request, url_for
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+from markupsafe import Markup
 from sqlalchemy import select
 from werkzeug.security import generate_password_hash
 
+from assets import VENDOR
 from config import Config
 from .classes.classes import Regions, Roles
-from .model.tables import db_session, Users
+from .depends.compress import compress_response
+from .depends.metrics import init_metrics
+from .depends.queries import init_query_checks
+from .depends.timing import init_timing
+from .model.search import create_search_index, rebuild_search_index
+from .model.tables import (
+    Counters,
+    Organizations,
+    Users,
+    backfill_last_checks,
+    backfill_names,
+    backfill_registered,
+    db_session,
+    rebuild_counters,
+    rebuild_organizations,
+)
+from .routes.metrics import bp as metrics_bp
 from .routes.route import bp as route_bp
 
 
@@ -22,12 +43,22 @@ def create_app(config_class=Config):
     """
     app = Flask(__name__)
     app.config.from_object(config_class)
+
+    if app.config.get("TEMPLATES_CACHE"):
+        if not os.path.isdir(app.config["TEMPLATES_CACHE"]):
+            os.makedirs(app.config["TEMPLATES_CACHE"])
+        app.jinja_options = app.jinja_options | {
+            "bytecode_cache": FileSystemBytecodeCache(app.config["TEMPLATES_CACHE"])
+        }
+
     app.register_blueprint(route_bp)
+    if app.config.get("METRICS"):
+        app.register_blueprint(metrics_bp)
 
-    if not os.path.isdir(Config.BASE_PATH):
-        os.mkdir(Config.BASE_PATH)
+    if not os.path.isdir(app.config["BASE_PATH"]):
+        os.mkdir(app.config["BASE_PATH"])
     for region in Regions:
-        region_path = os.path.join(Config.BASE_PATH, region.value)
+        region_path = os.path.join(app.config["BASE_PATH"], region.value)
         if not os.path.isdir(region_path):
             os.mkdir(region_path)
         for letter in "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЫЭЮЯ":
@@ -40,23 +71,129 @@ def create_app(config_class=Config):
             fullname="Администратор",
             username="superadmin",
             role=Roles.admin.value,
-            passhash=generate_password_hash(Config.DEFAULT_PASSWORD),
+            passhash=generate_password_hash(app.config["DEFAULT_PASSWORD"]),
             region=Regions.main.value,
         )
         db_session.add(admin)
         db_session.commit()
-        db_session.remove()
+    backfill_names()
+    backfill_last_checks()
+    backfill_registered()
+    if not db_session.scalar(select(Organizations.id).limit(1)):
+        rebuild_organizations()
+    if not db_session.scalar(select(Counters.name).limit(1)):
+        rebuild_counters()
+    if create_search_index():
+        rebuild_search_index()
+    db_session.remove()
+
+    if app.config.get("TEMPLATES_WARMUP"):
+        warmup_templates(app)
+
+    if app.config.get("METRICS"):
+        init_metrics(app)
+
+    if app.config.get("QUERY_CHECKS") is not False:
+        init_query_checks(app)
+
+    if app.config.get("SERVER_TIMING"):
+        init_timing(app)
+
+    if app.config.get("COMPRESS_ALGORITHMS"):
+        app.after_request(compress_response)
 
     @app.teardown_appcontext
     def shutdown_session(exception=None):
         db_session.remove()
 
+    assets = fingerprint_assets(app.static_folder)
+    fingerprinted = {value: key for key, value in assets.items()}
+
+    @app.template_global()
+    def asset(path):
+        if path in assets:
+            return url_for("static_file", path=assets[path])
+        if path in VENDOR:
+            return VENDOR[path][0]
+        return url_for("static_file", path=path)
+
+    @app.template_global()
+    def asset_integrity(path):
+        if path in assets or path not in VENDOR or not VENDOR[path][1]:
+            return ""
+        return Markup(' integrity="{}" crossorigin="anonymous"').format(
+            VENDOR[path][1]
+        )
+
     @app.get("/<path:path>")
     def static_file(path=""):
-        return app.send_static_file(path)
+        if path not in fingerprinted:
+            return app.send_static_file(path)
+        path = fingerprinted[path]
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding in request.accept_encodings and os.path.isfile(
+                os.path.join(app.static_folder, path + suffix)
+            ):
+                response = app.send_static_file(path + suffix)
+                response.content_encoding = encoding
+                response.mimetype = mimetypes.guess_type(path)[0]
+                break
+        else:
+            response = app.send_static_file(path)
+        response.vary.add("Accept-Encoding")
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+        return response
 
     @app.errorhandler(404)
     def not_found(error):
         return app.redirect("/")
 
     return app
+
+
+def warmup_templates(app):
+    """
+    Compile every template of the application into the Jinja environment.
+
+    Templates loaded from the bytecode cache skip the parser, so a warmed
+    worker serves the first profile page without the compile cost.
+
+    Parameters:
+        app (Flask): The application whose templates should be compiled.
+    """
+    for name in app.jinja_env.list_templates(extensions=["jinja"]):
+        try:
+            app.jinja_env.get_template(name)
+        except TemplateSyntaxError as e:
+            app.logger.warning("Template %s is not compiled: %s", name, e)
+
+
+def fingerprint_assets(static_folder):
+    """
+    Map every static file to a name carrying a hash of its content.
+
+    Fingerprinted URLs change whenever the file does, so they are served with
+    immutable cache headers. Precompressed .gz and .br variants are skipped,
+    they are picked by Accept-Encoding for their source file.
+
+    Parameters:
+        static_folder (str): The directory with static files.
+
+    Returns:
+        dict: Fingerprinted names keyed by the static file path.
+    """
+    assets = {}
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if name.endswith((".gz", ".br")):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:12]
+            path = os.path.relpath(file_path, static_folder).replace(os.sep, "/")
+            stem, ext = os.path.splitext(path)
+            assets[path] = f"{stem}.{digest}{ext}"
+    return assets
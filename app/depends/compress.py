@@ -0,0 +1,90 @@
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def make_compressor(encoding):
+    """
+    Create a streaming compressor for the given content encoding.
+
+    Returns:
+        tuple: compress, flush and finish callables of the compressor.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=current_app.config["COMPRESS_BR_LEVEL"])
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(
+        current_app.config["COMPRESS_LEVEL"],
+        zlib.DEFLATED,
+        16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS,
+    )
+    return (
+        compressor.compress,
+        lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush,
+    )
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compress a streamed response chunk by chunk.
+
+    Every chunk is flushed as it comes: a streamed template pauses between
+    chunks while it loads the next section, and the browser must be able to
+    render what was sent before the pause.
+    """
+    compress, flush, finish = make_compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+
+def compress_response(response):
+    """
+    Compress a response body with the best encoding accepted by the client.
+
+    Files sent with send_file, responses that are already encoded, content
+    types outside COMPRESS_MIMETYPES and bodies under COMPRESS_MIN_SIZE are
+    passed through unchanged.
+
+    Parameters:
+        response (Response): The response to compress.
+
+    Returns:
+        Response: The same response, compressed if applicable.
+    """
+    if (
+        response.direct_passthrough
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in current_app.config["COMPRESS_MIMETYPES"]
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    for encoding in current_app.config["COMPRESS_ALGORITHMS"]:
+        if encoding == "br" and brotli is None:
+            continue
+        if encoding in request.accept_encodings:
+            break
+    else:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+            return response
+        compress, _, finish = make_compressor(encoding)
+        response.set_data(compress(data) + finish())
+    response.content_encoding = encoding
+    return response
@@ -1,6 +1,6 @@
 from functools import wraps
 
-from flask import redirect, session
+from flask import g, redirect, session
 
 
 def login_required():
@@ -30,3 +30,24 @@ def roles_required(*roles):
         return wrapper
 
     return decorator
+
+
+def query_budget(limit):
+    """
+    Declare how many SQL statements a view may run per request.
+
+    Only takes effect when query checks are enabled, see QUERY_CHECKS.
+
+    Parameters:
+        limit (int): The maximum number of statements.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            g.query_budget = limit
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
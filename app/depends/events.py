@@ -0,0 +1,162 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..model.tables import Events, db_session, engine
+
+logger = logging.getLogger(__name__)
+
+
+def notify_person(person_id, event):
+    """
+    Add a "person changed" event to the current transaction.
+
+    The event becomes visible to the other workers only when the change it
+    describes is committed.
+
+    Parameters:
+        person_id (int): The ID of the changed person.
+        event (str): The kind of change, e.g. "busy", "resume" or "check".
+    """
+    db_session.add(Events(person_id=person_id, event=event))
+
+
+class Broker:
+    """
+    Fan-out of person events to the SSE streams of this process.
+
+    Worker processes share nothing but the database, so events are written to
+    the events table and one thread per process polls it for new rows. The
+    thread is started on first use and again after a fork.
+
+    Every stream holds a server thread, so their number is capped and all of
+    them are woken up and ended when the server shuts down.
+    """
+
+    def __init__(self, history=1000, retention=timedelta(hours=1)):
+        self.events = deque(maxlen=history)
+        self.retention = retention
+        self.condition = threading.Condition()
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.pid = None
+        self.streams = 0
+        self.stopping = threading.Event()
+
+    def start(self, interval):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.events.clear()
+            with engine.connect() as conn:
+                self.last_id = conn.scalar(select(func.max(Events.id))) or 0
+            threading.Thread(target=self.run, args=(interval,), daemon=True).start()
+
+    def run(self, interval):
+        prune_at = 0
+        while True:
+            try:
+                self.poll()
+                if time.monotonic() >= prune_at:
+                    self.prune()
+                    prune_at = time.monotonic() + 600
+            except SQLAlchemyError as e:
+                logger.warning("Events are not polled: %s", e)
+            time.sleep(interval)
+
+    def poll(self):
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(Events.id, Events.person_id, Events.event)
+                .where(Events.id > self.last_id)
+                .order_by(Events.id)
+            ).all()
+        if rows:
+            with self.condition:
+                self.events.extend(rows)
+                self.last_id = rows[-1].id
+                self.condition.notify_all()
+
+    def prune(self):
+        # created is set by SQLite in UTC, so the cutoff is computed there too
+        cutoff = func.datetime("now", f"-{int(self.retention.total_seconds())} seconds")
+        with engine.begin() as conn:
+            conn.execute(delete(Events).where(Events.created < cutoff))
+
+    def acquire(self, limit):
+        """
+        Take a stream slot, unless `limit` streams are already open.
+
+        Returns:
+            bool: True if the slot is taken and must be released.
+        """
+        with self.lock:
+            if limit and self.streams >= limit:
+                return False
+            self.streams += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.streams -= 1
+
+    def stop(self):
+        """
+        End the streams of this process, called when the server shuts down.
+        """
+        with self.condition:
+            self.stopping.set()
+            self.condition.notify_all()
+
+    def wait(self, cursor, timeout):
+        """
+        Wait up to `timeout` seconds for events newer than `cursor`.
+
+        Returns:
+            list: The new events as (id, person_id, event) rows.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.last_id > cursor or self.stopping.is_set(), timeout
+            )
+            return [row for row in self.events if row.id > cursor]
+
+
+broker = Broker()
+
+
+def event_stream(cursor, timeout, heartbeat, limit=None, backoff=10):
+    """
+    Generate a text/event-stream of person events after `cursor`.
+
+    Each event is named "person-<id>", so a page element subscribes to the
+    person it shows. The stream ends after `timeout` seconds or on server
+    shutdown to give the server thread back, EventSource reconnects with
+    Last-Event-ID. When `limit` streams are already open, the stream ends at
+    once and asks the browser to retry after `backoff` seconds.
+    """
+    if not broker.acquire(limit):
+        yield f"retry: {backoff * 1000}\nid: {cursor}\n\n"
+        return
+    try:
+        deadline = time.monotonic() + timeout
+        yield f"retry: 1000\nid: {cursor}\n\n"
+        while time.monotonic() < deadline and not broker.stopping.is_set():
+            rows = broker.wait(cursor, min(heartbeat, deadline - time.monotonic()))
+            if not rows:
+                yield ": ping\n\n"
+            for row in rows:
+                yield (
+                    f"id: {row.id}\nevent: person-{row.person_id}\n"
+                    f"data: {row.event}\n\n"
+                )
+                cursor = row.id
+    finally:
+        broker.release()
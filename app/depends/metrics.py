@@ -0,0 +1,256 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from ..model.tables import engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Registry:
+    """
+    Request and database counters of the current process.
+
+    Every sample is a plain number in a dict keyed by metric name and label
+    values, updated under one lock that is held for a few dict operations.
+    With several worker processes each of them writes its samples to
+    METRICS_DIR, and the worker answering the scrape adds them up.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(float)
+        self.directory = None
+        self.pid = None
+
+    def inc(self, name, labels=(), value=1):
+        with self.lock:
+            self.samples[name, labels] += value
+
+    def observe(self, name, labels, value):
+        index = bisect_left(BUCKETS, value)
+        with self.lock:
+            self.samples[name + "_sum", labels] += value
+            self.samples[name + "_count", labels] += 1
+            if index < len(BUCKETS):
+                self.samples[name + "_bucket", labels + (index,)] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.samples.items())
+
+    def start(self, directory, interval=5):
+        """Write the samples to `directory` every `interval` seconds."""
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.directory = directory
+        self.samples.clear()
+        threading.Thread(target=self.run, args=(interval,), daemon=True).start()
+
+    def run(self, interval):
+        while True:
+            time.sleep(interval)
+            self.dump()
+
+    def dump(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        samples = self.snapshot()
+        rows = [[name, list(labels), value] for (name, labels), value in samples]
+        with open(path + ".tmp", "w") as f:
+            json.dump(rows, f)
+        os.replace(path + ".tmp", path)
+
+    def collect(self):
+        """
+        Samples of this process plus the last dump of every other worker.
+
+        Gauges of workers that are no longer running are left out, their
+        counters are kept so the totals do not go backwards.
+        """
+        samples = defaultdict(float)
+        for key, value in self.snapshot():
+            samples[key] += value
+        if not self.directory:
+            return samples
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name == f"{os.getpid()}.json":
+                continue
+            alive = pid_alive(int(name.split(".")[0]))
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    rows = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric, labels, value in rows:
+                if alive or metric not in GAUGES:
+                    samples[metric, tuple(labels)] += value
+        return samples
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+registry = Registry()
+
+METRICS = {
+    "staffsec_http_request_duration_seconds": (
+        "histogram",
+        "Time until the response headers are sent, by Flask endpoint.",
+        ("endpoint", "method"),
+    ),
+    "staffsec_http_requests_total": (
+        "counter",
+        "Responses by Flask endpoint and status code.",
+        ("endpoint", "method", "status"),
+    ),
+    "staffsec_http_requests_in_flight": (
+        "gauge",
+        "Requests being handled.",
+        (),
+    ),
+    "staffsec_upload_bytes_total": (
+        "counter",
+        "Bytes of multipart uploads by Flask endpoint.",
+        ("endpoint",),
+    ),
+    "staffsec_db_pool_checkouts_total": (
+        "counter",
+        "Connections checked out of the SQLAlchemy pool.",
+        (),
+    ),
+    "staffsec_sqlite_locked_total": (
+        "counter",
+        "Statements that failed with 'database is locked' after the busy timeout.",
+        (),
+    ),
+}
+GAUGES = {name for name, (kind, _, _) in METRICS.items() if kind == "gauge"}
+
+
+@event.listens_for(engine, "checkout")
+def on_checkout(dbapi_connection, connection_record, connection_proxy):
+    registry.inc("staffsec_db_pool_checkouts_total")
+
+
+@event.listens_for(engine, "handle_error")
+def on_error(context):
+    if isinstance(context.sqlalchemy_exception, OperationalError) and (
+        "database is locked" in str(context.original_exception)
+    ):
+        registry.inc("staffsec_sqlite_locked_total")
+
+
+def start_request():
+    if current_app.config["METRICS_DIR"] and registry.pid != os.getpid():
+        registry.start(current_app.config["METRICS_DIR"])
+    g.metrics_started = time.perf_counter()
+    registry.inc("staffsec_http_requests_in_flight")
+    if request.mimetype == "multipart/form-data" and request.content_length:
+        registry.inc(
+            "staffsec_upload_bytes_total",
+            (request.endpoint or "",),
+            request.content_length,
+        )
+
+
+def finish_request(response):
+    if "metrics_started" in g:
+        labels = (request.endpoint or "", request.method)
+        registry.observe(
+            "staffsec_http_request_duration_seconds",
+            labels,
+            time.perf_counter() - g.metrics_started,
+        )
+        registry.inc(
+            "staffsec_http_requests_total", labels + (str(response.status_code),)
+        )
+    return response
+
+
+def end_request(exception=None):
+    if "metrics_started" in g:
+        registry.inc("staffsec_http_requests_in_flight", value=-1)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def render_metrics():
+    """
+    Render all samples in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics page.
+    """
+    samples = registry.collect()
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind != "histogram":
+            series = {
+                labels: value
+                for (metric, labels), value in samples.items()
+                if metric == name
+            }
+            if not label_names:
+                series.setdefault((), 0)
+            for labels, value in sorted(series.items()):
+                lines.append(
+                    f"{name}{format_labels(label_names, labels)} {format_value(value)}"
+                )
+            continue
+        series = sorted(
+            labels for (metric, labels) in samples if metric == name + "_count"
+        )
+        for labels in series:
+            le_names = label_names + ("le",)
+            cumulative = 0
+            for index, bound in enumerate(BUCKETS):
+                cumulative += samples.get((name + "_bucket", labels + (index,)), 0)
+                le_labels = format_labels(le_names, labels + (f"{bound:g}",))
+                lines.append(f"{name}_bucket{le_labels} {format_value(cumulative)}")
+            count = format_value(samples[name + "_count", labels])
+            total = samples[name + "_sum", labels]
+            le_labels = format_labels(le_names, labels + ("+Inf",))
+            lines.append(f"{name}_bucket{le_labels} {count}")
+            lines.append(f"{name}_sum{format_labels(label_names, labels)} {total}")
+            lines.append(f"{name}_count{format_labels(label_names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def init_metrics(app):
+    """
+    Collect request metrics of the application.
+
+    Parameters:
+        app (Flask): The application to instrument.
+    """
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(end_request)
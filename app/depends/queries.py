@@ -0,0 +1,118 @@
+import json
+import logging
+import re
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from ..model.tables import engine
+
+logger = logging.getLogger("app.query_checks")
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement):
+    """
+    Reduce an SQL statement to its shape.
+
+    Literals become placeholders and IN lists of any length collapse to one,
+    so the same query run for different rows is counted as one shape.
+
+    Parameters:
+        statement (str): The SQL statement sent to the database.
+
+    Returns:
+        str: The normalized statement.
+    """
+    statement = LITERALS.sub("?", statement)
+    statement = PLACEHOLDER_LISTS.sub("(?)", statement)
+    return WHITESPACE.sub(" ", statement).strip()
+
+
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "queries" in g:
+        g.queries.append(statement)
+
+
+def checks_enabled():
+    enabled = current_app.config["QUERY_CHECKS"]
+    if enabled is None:
+        return current_app.debug or current_app.testing
+    return enabled
+
+
+def start_checks():
+    if checks_enabled():
+        g.queries = []
+
+
+def find_problems(queries, repeat_limit, budget):
+    problems = []
+    if budget is not None and len(queries) > budget:
+        problems.append(f"{len(queries)} queries, the budget is {budget}")
+    shapes = Counter(normalize_statement(statement) for statement in queries)
+    for shape, count in shapes.most_common():
+        if count <= repeat_limit:
+            break
+        problems.append(f"{count} times: {shape}")
+    return problems
+
+
+def log_problems(endpoint, problems):
+    if problems:
+        logger.warning(
+            json.dumps({"endpoint": endpoint, "problems": problems}, ensure_ascii=False)
+        )
+
+
+def check_queries(response):
+    """
+    Report requests that exceed their query budget or repeat a statement.
+
+    The budget comes from the query_budget decorator of the view, or from
+    QUERY_BUDGET. In testing mode the request fails with an AssertionError;
+    otherwise the problems are logged to app.query_checks. Streamed templates
+    run most of their queries after this hook, so they are checked when the
+    response is closed and can only be logged.
+
+    Parameters:
+        response (Response): The response of the request.
+
+    Returns:
+        Response: The same response.
+    """
+    if "queries" not in g:
+        return response
+    queries = g.queries
+    endpoint = request.endpoint
+    repeat_limit = current_app.config["QUERY_REPEAT_LIMIT"]
+    budget = g.get("query_budget", current_app.config["QUERY_BUDGET"])
+    if response.is_streamed and not response.direct_passthrough:
+        response.call_on_close(
+            lambda: log_problems(
+                endpoint, find_problems(queries, repeat_limit, budget)
+            )
+        )
+        return response
+    problems = find_problems(queries, repeat_limit, budget)
+    if problems and current_app.testing:
+        raise AssertionError(f"{endpoint}: " + "; ".join(problems))
+    log_problems(endpoint, problems)
+    return response
+
+
+def init_query_checks(app):
+    """
+    Count the statements of every request in debug and testing mode.
+
+    Parameters:
+        app (Flask): The application to check.
+    """
+    if not event.contains(engine, "before_cursor_execute", record_query):
+        event.listen(engine, "before_cursor_execute", record_query)
+    app.before_request(start_checks)
+    app.after_request(check_queries)
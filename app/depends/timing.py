@@ -0,0 +1,133 @@
+import json
+import logging
+import time
+
+from flask import (
+    before_render_template,
+    current_app,
+    g,
+    has_request_context,
+    request,
+    template_rendered,
+)
+from sqlalchemy import event
+
+from ..model.tables import engine
+
+logger = logging.getLogger("app.slow_query")
+request_logger = logging.getLogger("app.request_timing")
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if not has_request_context() or "request_started" not in g:
+        return
+    g.db_count += 1
+    g.db_time += elapsed
+    if elapsed * 1000 >= current_app.config["SLOW_QUERY_MS"]:
+        logger.warning(
+            json.dumps(
+                {
+                    "ms": round(elapsed * 1000, 1),
+                    "endpoint": request.endpoint,
+                    "method": request.method,
+                    "path": request.path,
+                    "statement": statement,
+                    "parameters": parameters,
+                },
+                ensure_ascii=False,
+                default=str,
+            )
+        )
+
+
+@event.listens_for(engine, "handle_error")
+def handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+def start_timing():
+    g.request_started = time.perf_counter()
+    g.db_count = 0
+    g.db_time = 0.0
+    g.render_time = 0.0
+
+
+def start_render(sender, template, context, **extra):
+    if "request_started" not in g:
+        return
+    g.render_started = time.perf_counter()
+
+
+def finish_render(sender, template, context, **extra):
+    if "render_started" in g:
+        g.render_time += time.perf_counter() - g.render_started
+
+
+def server_timing(response):
+    """
+    Add a Server-Timing header with database, template and total time.
+
+    Streamed templates are still rendering when the headers go out, so for
+    them the header covers the work done before the first byte. The full
+    figures are logged to app.request_timing at INFO level once the response
+    is closed.
+
+    Parameters:
+        response (Response): The response of the request.
+
+    Returns:
+        Response: The same response with the Server-Timing header.
+    """
+    if "request_started" not in g:
+        return response
+    total = time.perf_counter() - g.request_started
+    response.headers["Server-Timing"] = ", ".join(
+        [
+            f'db;dur={g.db_time * 1000:.1f};desc="{g.db_count} queries"',
+            f"render;dur={g.render_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ]
+    )
+    if request_logger.isEnabledFor(logging.INFO):
+        stats = g._get_current_object()
+        endpoint = request.endpoint
+
+        def log_timing():
+            request_logger.info(
+                json.dumps(
+                    {
+                        "endpoint": endpoint,
+                        "status": response.status_code,
+                        "queries": stats.db_count,
+                        "db_ms": round(stats.db_time * 1000, 1),
+                        "render_ms": round(stats.render_time * 1000, 1),
+                        "total_ms": round(
+                            (time.perf_counter() - stats.request_started) * 1000, 1
+                        ),
+                    }
+                )
+            )
+
+        response.call_on_close(log_timing)
+    return response
+
+
+def init_timing(app):
+    """
+    Measure queries, template rendering and total time of every request.
+
+    Parameters:
+        app (Flask): The application to instrument.
+    """
+    app.before_request(start_timing)
+    app.after_request(server_timing)
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(finish_render, app)
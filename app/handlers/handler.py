@@ -1,12 +1,76 @@
 import os
+import re
+from datetime import date, datetime, timedelta
 
 from flask import abort, current_app, session
 from PIL import Image
 from pydantic import ValidationError
-from sqlalchemy import desc, select
+from sqlalchemy import (
+    String,
+    case,
+    desc,
+    func,
+    literal,
+    select,
+    tuple_,
+    type_coerce,
+    union_all,
+)
+from werkzeug.security import check_password_hash
 
+from ..classes.classes import Conclusions, Regions
+from ..depends.events import notify_person
 from ..model.models import AnketaSchemaJson
-from ..model.tables import Users, db_session, Persons, tables_models
+from ..model.names import (
+    find_inns,
+    name_prefix,
+    normalize_name,
+    normalize_organization,
+)
+from ..model.search import index_text
+from ..model.tables import (
+    Checks,
+    Counters,
+    Organizations,
+    Persons,
+    Poligrafs,
+    Previous,
+    Relations,
+    Users,
+    db_session,
+    tables_models,
+)
+
+relations_cache = {}
+turnaround_cache = {}
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+# facets of the persons list: the grouped column and the parser of form values
+FACETS = {
+    "region": (Persons.region, str),
+    "user": (Persons.user_id, int),
+    "busy": (Persons.isbusy, lambda value: value == "1"),
+    "citizenship": (Persons.citizenship, str),
+    "period": (func.strftime("%Y-%m", Persons.created), str),
+}
+
+# the column shown for a row of every child table on the person timeline
+TIMELINE = {
+    "previous": "surname",
+    "educations": "institution",
+    "staffs": "position",
+    "documents": "view",
+    "addresses": "addresses",
+    "contacts": "contact",
+    "relations": "relation",
+    "workplaces": "workplace",
+    "affilations": "organization",
+    "checks": "conclusion",
+    "poligrafs": "theme",
+    "investigations": "theme",
+    "inquiries": "info",
+}
 
 
 def handle_users():
@@ -15,6 +79,50 @@ def handle_users():
     return result
 
 
+def handle_login(username, password):
+    """
+    Checks the credentials of a user.
+
+    A wrong password counts as a failed attempt, the user is blocked after
+    five of them.
+
+    Args:
+        username (str): The login of the user.
+        password (str): The password to check.
+
+    Returns:
+        tuple: The user and None if the credentials are valid, otherwise None
+               and the error message.
+    """
+    user = db_session.execute(
+        select(Users).where(Users.username == username)
+    ).scalar_one_or_none()
+    if not user or user.blocked or user.deleted:
+        return None, "Полььзователь не найден или заблокирован"
+
+    if not check_password_hash(user.passhash, password or ""):
+        if user.attempt < 5:
+            user.attempt += 1
+        else:
+            user.blocked = True
+        db_session.commit()
+        return None, "Неверный логин или пароль"
+    return user, None
+
+
+def password_expired(user):
+    """
+    Tells whether the user must change the password before logging in.
+
+    Args:
+        user (Users): The user.
+
+    Returns:
+        bool: True if the password must be changed or is older than a year.
+    """
+    return user.change_pswd or (datetime.now() - user.pswd_create).days >= 365
+
+
 def handle_get_item(item, item_id):
     """
     Retrieves an item from the database based on the provided item and item_id.
@@ -24,7 +132,8 @@ def handle_get_item(item, item_id):
         item_id (int): The ID of the item to retrieve.
 
     Returns:
-        dict or list: If item is "persons", a dictionary containing the item's data and the associated user's fullname.
+        dict or list: If item is "persons", a dictionary containing the item's data and the associated user's fullname,
+                      or None if there is no such person.
                       Otherwise, a list of dictionaries containing the item's data and the associated user's fullname,
                       ordered by descending item ID.
 
@@ -42,7 +151,540 @@ def handle_get_item(item, item_id):
         )
     query = db_session.execute(stmt).all()
     result = [row[0].to_dict() | {"username": row[1]} for row in query]
-    return result[0] if item == "persons" else result
+    if item == "relations" and result:
+        names = handle_persons_names({row["relation_id"] for row in result})
+        for row in result:
+            row["related"] = names.get(row["relation_id"])
+    if item == "affilations" and result:
+        handle_affilation_links(result)
+    if item == "persons":
+        return result[0] if result else None
+    return result
+
+
+def handle_persons_names(person_ids):
+    """
+    Resolves names and the latest check conclusion of several persons at once.
+
+    Args:
+        person_ids (Iterable[int]): The IDs of the persons.
+
+    Returns:
+        dict: Dictionaries with id, names, birthday and conclusion keyed by
+              the person ID. Persons that do not exist are left out.
+    """
+    query = db_session.execute(
+        select(
+            Persons.id,
+            Persons.surname,
+            Persons.firstname,
+            Persons.patronymic,
+            Persons.birthday,
+            Persons.last_conclusion.label("conclusion"),
+        ).where(Persons.id.in_(person_ids))
+    ).all()
+    return {row.id: row._asdict() for row in query}
+
+
+def handle_affilation_links(affilations):
+    """
+    Adds to every affiliation the other persons tied to the same organization.
+
+    Args:
+        affilations (list): Affiliation dictionaries of one person, updated in
+                            place with a "linked" list of person dictionaries.
+    """
+    person_id = affilations[0]["person_id"]
+    inns = set().union(*(find_inns(row["inn"]) for row in affilations))
+    names = {normalize_organization(row["organization"]) for row in affilations}
+    names.discard(None)
+    query = db_session.execute(
+        select(Organizations.person_id, Organizations.inn, Organizations.norm_name)
+        .where(Organizations.inn.in_(inns) | Organizations.norm_name.in_(names))
+        .where(Organizations.person_id != person_id)
+        .distinct()
+    ).all()
+    persons = handle_persons_names({row.person_id for row in query}) if query else {}
+    for affilation in affilations:
+        keys = find_inns(affilation["inn"])
+        name = normalize_organization(affilation["organization"])
+        linked = {
+            row.person_id
+            for row in query
+            if row.inn in keys or (name and row.norm_name == name)
+        }
+        affilation["linked"] = [
+            persons[pid] for pid in sorted(linked) if pid in persons
+        ]
+
+
+def handle_organization_links(inn=None, name=None, limit=200):
+    """
+    Finds the persons tied to an organization by INN or by name prefix.
+
+    Affiliations, workplaces and check results are searched through the
+    organizations index.
+
+    Args:
+        inn (str): The exact INN of the organization.
+        name (str): The beginning of the organization name.
+        limit (int): The maximum number of links read.
+
+    Returns:
+        list: Person dictionaries with a "links" list of the matching
+              organizations, ordered by name.
+    """
+    stmt = select(
+        Organizations.person_id,
+        Organizations.organization,
+        Organizations.inn,
+        Organizations.source,
+    )
+    if inn:
+        stmt = stmt.where(Organizations.inn == inn.strip())
+    else:
+        stmt = stmt.where(
+            name_prefix(Organizations.norm_name, normalize_organization(name) or "")
+        )
+    query = db_session.execute(stmt.limit(limit)).all()
+    if not query:
+        return []
+    persons = handle_persons_names({row.person_id for row in query})
+    links = {}
+    for row in query:
+        if row.person_id in persons:
+            links.setdefault(row.person_id, persons[row.person_id] | {"links": []})
+            links[row.person_id]["links"].append(row._asdict())
+    return sorted(
+        links.values(),
+        key=lambda person: (person["surname"], person["firstname"], person["id"]),
+    )
+
+
+def handle_relations_graph(person_id, depth):
+    """
+    Collects every person connected to a person within `depth` hops.
+
+    Relations are followed in both directions by a recursive query. The
+    found persons and relations are cached per person until the relations
+    table changes, names and conclusions are read anew on every call.
+
+    Args:
+        person_id (int): The ID of the person in the centre of the graph.
+        depth (int): The maximum number of hops.
+
+    Returns:
+        list: Dictionaries of the connected persons ordered by distance, each
+              with the relations that lead to it from closer persons.
+    """
+    version = tuple(
+        db_session.execute(
+            select(
+                func.count(Relations.id),
+                func.max(Relations.id),
+                func.max(Relations.created),
+            )
+        ).one()
+    )
+    cached = relations_cache.get((person_id, depth))
+    if cached and cached[0] == version:
+        _, hops, edges = cached
+    else:
+        graph = select(
+            literal(person_id).label("node"), literal(0).label("hops")
+        ).cte("graph", recursive=True)
+        found = graph.alias()
+        graph = graph.union(
+            select(Relations.relation_id, found.c.hops + 1)
+            .join(found, Relations.person_id == found.c.node)
+            .where(found.c.hops < depth, Relations.relation_id.is_not(None)),
+            select(Relations.person_id, found.c.hops + 1)
+            .join(found, Relations.relation_id == found.c.node)
+            .where(found.c.hops < depth),
+        )
+        hops = dict(
+            db_session.execute(
+                select(graph.c.node, func.min(graph.c.hops)).group_by(graph.c.node)
+            ).all()
+        )
+        edges = [
+            tuple(row)
+            for row in db_session.execute(
+                select(Relations.person_id, Relations.relation_id, Relations.relation)
+                .where(Relations.person_id.in_(hops))
+                .where(Relations.relation_id.in_(hops))
+            ).all()
+        ]
+        if len(relations_cache) >= 1024:
+            relations_cache.clear()
+        relations_cache[person_id, depth] = version, hops, edges
+
+    names = handle_persons_names(hops)
+    result = []
+    for node, distance in sorted(hops.items(), key=lambda item: (item[1], item[0])):
+        if node == person_id or node not in names:
+            continue
+        via = []
+        for source, target, relation in edges:
+            other = target if source == node else source if target == node else None
+            if other in names and hops[other] == distance - 1:
+                via.append({"relation": relation, "person": names[other]})
+        result.append(names[node] | {"hops": distance, "via": via})
+    return result
+
+
+def handle_persons_filters(form):
+    """
+    Builds the conditions of the persons list from the filter form.
+
+    Args:
+        form (MultiDict): The submitted search, status, conclusion, check date
+            and facet fields.
+
+    Returns:
+        tuple: The conditions of every field except the facets, and the
+               selected values keyed by facet name.
+    """
+    conditions = []
+    status = form.get("status")
+    if status == "busy":
+        conditions += [Persons.isbusy, Persons.user_id == session["user"]["id"]]
+    elif status == "pending":
+        conditions.append(Persons.isbusy)
+    elif status == "unchecked":
+        conditions.append(Persons.last_checked_at.is_(None))
+    conclusion = form.get("conclusion")
+    if conclusion == "none":
+        conditions.append(Persons.last_conclusion.is_(None))
+    elif conclusion in {item.value for item in Conclusions}:
+        conditions.append(Persons.last_conclusion == conclusion)
+    checked_from = form.get("checked_from", type=date.fromisoformat)
+    if checked_from:
+        conditions.append(Persons.last_checked_at >= checked_from)
+    checked_to = form.get("checked_to", type=date.fromisoformat)
+    if checked_to:
+        conditions.append(Persons.last_checked_at < checked_to + timedelta(days=1))
+    search_data = form.get("search")
+    if search_data and len(search_data) > 2:
+        if search_data.isdigit():
+            conditions.append(Persons.inn.ilike("%" + search_data + "%"))
+        else:
+            pattern = r"^\d{2}\.\d{2}\.\d{4}$"
+            translit = current_app.config["NAMES_TRANSLIT"]
+            query = [
+                normalize_name(word, translit) or "" for word in search_data.split()
+            ]
+            if len(query):
+                previous = select(Previous.person_id).where(
+                    name_prefix(Previous.norm_surname, query[0])
+                )
+                conditions.append(
+                    name_prefix(Persons.norm_surname, query[0])
+                    | Persons.id.in_(previous)
+                )
+            if len(query) > 1 and not re.match(pattern, query[1]):
+                conditions.append(name_prefix(Persons.norm_firstname, query[1]))
+            if len(query) > 2 and not re.match(pattern, query[2]):
+                conditions.append(name_prefix(Persons.norm_patronymic, query[2]))
+            if len(query) > 1 and re.match(pattern, query[-1]):
+                conditions.append(
+                    Persons.birthday == datetime.strptime(query[-1], "%d.%m.%Y").date()
+                )
+    if session["user"]["region"] != Regions.main.value:
+        conditions.append(Persons.region == session["user"]["region"])
+    selected = {name: set(form.getlist(name)) for name in FACETS if name in form}
+    return conditions, selected
+
+
+def facet_key(value):
+    """The form value of a facet value."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value)
+
+
+def facet_conditions(selected):
+    """
+    The conditions of the selected facet values.
+
+    Values of one facet are alternatives, different facets must all match.
+    The empty value selects persons without a value.
+    """
+    conditions = []
+    for name, values in selected.items():
+        column, parse = FACETS[name]
+        known = []
+        for value in values - {""}:
+            try:
+                known.append(parse(value))
+            except ValueError:
+                pass
+        condition = column.in_(known)
+        if "" in values:
+            condition |= column.is_(None)
+        conditions.append(condition)
+    return conditions
+
+
+def handle_facets(conditions, selected):
+    """
+    Counts the persons of every facet value at once.
+
+    One query groups the persons matching the other filters by all facet
+    columns together. The count of a facet value adds up the groups that
+    match the selections of the other facets, so choosing a value of a
+    facet narrows the counts of the rest but not its own alternatives.
+
+    Args:
+        conditions (list): The conditions of the non-facet filters.
+        selected (dict): Sets of selected values keyed by facet name.
+
+    Returns:
+        dict: Lists of values with key, label, count and checked flag keyed by
+              facet name.
+    """
+    columns = [column.label(name) for name, (column, _) in FACETS.items()]
+    rows = db_session.execute(
+        select(*columns, Users.fullname, func.count(Persons.id).label("count"))
+        .outerjoin(Users, Users.id == Persons.user_id)
+        .where(*conditions)
+        .group_by(*columns, Users.fullname)
+    ).all()
+    facets = {name: {} for name in FACETS}
+    for row in rows:
+        keys = {name: facet_key(getattr(row, name)) for name in FACETS}
+        for name, values in facets.items():
+            if any(
+                keys[other] not in choice
+                for other, choice in selected.items()
+                if other != name
+            ):
+                continue
+            if keys[name] not in values:
+                label = getattr(row, name)
+                if name == "user":
+                    label = row.fullname
+                elif name == "busy":
+                    label = "В работе" if label else "Окончено"
+                values[keys[name]] = {"key": keys[name], "label": label, "count": 0}
+            values[keys[name]]["count"] += row.count
+    result = {}
+    for name, values in facets.items():
+        for key in selected.get(name, ()):
+            values.setdefault(key, {"key": key, "label": key, "count": 0})
+        items = sorted(values.values(), key=lambda item: (-item["count"], item["key"]))
+        if name == "period":
+            items.sort(key=lambda item: item["key"], reverse=True)
+        result[name] = [
+            item | {"checked": item["key"] in selected.get(name, ())} for item in items
+        ]
+    return result
+
+
+def handle_counters():
+    """
+    Reads the dashboard counters of the current user.
+
+    Users of the main office see the sums over all regions.
+
+    Returns:
+        dict: The values of the busy, pending and unchecked counters.
+    """
+    user = session["user"]
+    region = Counters.scope == "region"
+    if user["region"] != Regions.main.value:
+        region &= Counters.key == user["region"]
+    rows = db_session.execute(
+        select(Counters.name, func.sum(Counters.value))
+        .where(
+            ((Counters.scope == "user") & (Counters.key == str(user["id"]))) | region
+        )
+        .group_by(Counters.name)
+    ).all()
+    return {"busy": 0, "pending": 0, "unchecked": 0} | dict(rows)
+
+
+def handle_turnaround(start, end, region=None, group="region"):
+    """
+    Computes percentiles of the check turnaround times in days.
+
+    Two intervals are measured for every person whose first check falls in
+    the period: from the registration of the person to the first check, and
+    from the first check to the first polygraph examination after it.
+
+    The intervals are computed and ranked by window functions in one query,
+    each percentile is the smallest value whose rank reaches it. Results
+    are cached per period until persons, checks or polygraphs change.
+
+    Args:
+        start (date): The first day of the period.
+        end (date): The last day of the period.
+        region (str): Only count persons of this region, all if None.
+        group (str): Break the figures down by "region", "user" or "month".
+
+    Returns:
+        list: Dictionaries with the metric ("check" or "poligraf"), the group,
+              the number of persons and the percentiles p50, p90 and p99.
+    """
+    columns = []
+    for model in (Persons, Checks, Poligrafs):
+        columns.append(select(func.count(model.id)).scalar_subquery())
+        columns.append(select(func.max(model.created)).scalar_subquery())
+    version = tuple(db_session.execute(select(*columns)).one())
+    key = start, end, region, group
+    cached = turnaround_cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    first = (
+        select(Checks.person_id, func.min(Checks.created).label("checked"))
+        .group_by(Checks.person_id)
+        .subquery()
+    )
+    poligraf = (
+        select(func.min(Poligrafs.created))
+        .where(
+            Poligrafs.person_id == first.c.person_id,
+            Poligrafs.created >= first.c.checked,
+        )
+        .scalar_subquery()
+    )
+    pairs = (
+        select(
+            Persons.region,
+            Users.fullname.label("user"),
+            func.strftime("%Y-%m", first.c.checked).label("month"),
+            (
+                func.julianday(first.c.checked) - func.julianday(Persons.registered)
+            ).label("check"),
+            (func.julianday(poligraf) - func.julianday(first.c.checked)).label(
+                "poligraf"
+            ),
+        )
+        .join(Persons, Persons.id == first.c.person_id)
+        .outerjoin(Users, Users.id == Persons.user_id)
+        .where(
+            first.c.checked >= start,
+            first.c.checked < end + timedelta(days=1),
+        )
+    )
+    if region:
+        pairs = pairs.where(Persons.region == region)
+    pairs = pairs.subquery()
+
+    ranked = []
+    for metric in ("check", "poligraf"):
+        days, by = pairs.c[metric], pairs.c[group]
+        ranked.append(
+            select(
+                literal(metric).label("metric"),
+                by.label("key"),
+                days.label("days"),
+                func.row_number().over(partition_by=by, order_by=days).label("rank"),
+                func.count().over(partition_by=by).label("total"),
+            ).where(days.is_not(None))
+        )
+    ranked = union_all(*ranked).subquery()
+    rows = db_session.execute(
+        select(
+            ranked.c.metric,
+            ranked.c.key,
+            func.max(ranked.c.total).label("count"),
+            *(
+                func.min(
+                    case((ranked.c.rank >= share * ranked.c.total, ranked.c.days))
+                ).label(f"p{round(share * 100)}")
+                for share in PERCENTILES
+            ),
+        )
+        .group_by(ranked.c.metric, ranked.c.key)
+        .order_by(ranked.c.metric, ranked.c.key)
+    ).all()
+    result = [row._asdict() for row in rows]
+    if len(turnaround_cache) >= 256:
+        turnaround_cache.clear()
+    turnaround_cache[key] = version, result
+    return result
+
+
+def handle_timeline(person_id, after=None, limit=20):
+    """
+    Collects the newest rows of all child tables of a person.
+
+    Every table contributes at most `limit` + 1 rows read backwards along its
+    (person_id, created) index, the branches are merged by one UNION ALL
+    query that also joins the author of each row. Pages are ordered by
+    created, table and ID, and the next page starts after the last row of
+    the previous one, compared on the stored timestamp text.
+
+    Args:
+        person_id (int): The ID of the person.
+        after (tuple): The (stamp, item, id) of the last row already shown.
+        limit (int): The number of rows of a page.
+
+    Returns:
+        tuple: Dictionaries of the rows, newest first, and the position to
+               pass as `after` for the next page, None on the last page.
+    """
+    branches = []
+    for item, field in TIMELINE.items():
+        model = tables_models[item]
+        stamp = type_coerce(model.created, String)
+        stmt = select(
+            literal(item).label("item"),
+            model.id,
+            model.created,
+            stamp.label("stamp"),
+            getattr(model, field).label("summary"),
+            model.user_id,
+        ).where(model.person_id == person_id, model.created.is_not(None))
+        if after:
+            after_stamp, after_item, after_id = after
+            if item < after_item:
+                stmt = stmt.where(stamp <= after_stamp)
+            elif item == after_item:
+                stmt = stmt.where(
+                    tuple_(stamp, model.id) < tuple_(after_stamp, after_id)
+                )
+            else:
+                stmt = stmt.where(stamp < after_stamp)
+        stmt = stmt.order_by(model.created.desc(), model.id.desc()).limit(limit + 1)
+        branches.append(select(stmt.subquery()))
+    timeline = union_all(*branches).subquery()
+    rows = db_session.execute(
+        select(timeline, Users.fullname)
+        .outerjoin(Users, Users.id == timeline.c.user_id)
+        .order_by(
+            timeline.c.stamp.desc(), timeline.c.item.desc(), timeline.c.id.desc()
+        )
+        .limit(limit + 1)
+    ).all()
+    events = [row._asdict() for row in rows[:limit]]
+    if len(rows) <= limit:
+        return events, None
+    last = events[-1]
+    return events, (last["stamp"], last["item"], last["id"])
+
+
+class ProfileItems(dict):
+    """
+    A person's profile sections, each queried on first access.
+
+    Templates rendered with stream_template read the sections in page order,
+    so the header is sent before the heavy collections are loaded.
+    """
+
+    def __init__(self, person_id):
+        super().__init__()
+        self.person_id = person_id
+
+    def __missing__(self, item):
+        if item not in tables_models:
+            raise KeyError(item)
+        self[item] = handle_get_item(item, self.person_id)
+        return self[item]
 
 
 def handle_take_resume(resume):
@@ -63,14 +705,17 @@ def handle_take_resume(resume):
     resume["user_id"] = session["user"]["id"]
     resume["region"] = session["user"]["region"]
     if not resume.get("id"):
-        person = db_session.execute(
+        translit = current_app.config["NAMES_TRANSLIT"]
+        person = db_session.scalars(
             select(Persons).where(
-                Persons.surname.ilike("%{}%".format(resume["surname"])),
-                Persons.firstname.ilike("%{}%".format(resume["firstname"])),
-                Persons.patronymic.ilike("%{}%".format(resume["patronymic"])),
+                Persons.norm_surname == normalize_name(resume["surname"], translit),
+                Persons.norm_firstname
+                == normalize_name(resume["firstname"], translit),
+                Persons.norm_patronymic
+                == normalize_name(resume.get("patronymic"), translit),
                 Persons.birthday == resume["birthday"],
             )
-        ).scalar_one_or_none()
+        ).first()
         if not person:
             person = Persons(**resume)
             db_session.add(person)
@@ -82,12 +727,14 @@ def handle_take_resume(resume):
                 resume.get("patronymic", ""),
                 person.id,
             )
+            notify_person(person.id, "resume")
             db_session.commit()
             return person.id
         else:
             if person.user_id != session["user"]["id"] or person.isbusy:
                 return abort(400)
             resume["id"] = person.id
+    notify_person(resume["id"], "resume")
     handle_post_item(resume, "persons")
     return resume["id"]
 
@@ -102,20 +749,33 @@ def handle_post_item(json_dict, item, item_id=""):
         item_id (int): The ID of the item to update.
 
     Returns:
-        None
+        The inserted or updated row.
     """
     if item != "persons":
         json_dict["person_id"] = item_id
         json_dict["user_id"] = session["user"]["id"]
     if "id" in json_dict and json_dict["id"] == "":
         del json_dict["id"]
-    db_session.merge(tables_models[item](**json_dict))
+    row = db_session.merge(tables_models[item](**json_dict))
+    db_session.flush()
+    index_text(item, row)
     db_session.commit()
+    return row
 
 
 def handle_json_to_dict(data):
+    """
+    Validate an uploaded anketa and split it into rows of the profile tables.
+
+    Args:
+        data (bytes): The raw JSON document of the anketa.
+
+    Returns:
+        dict: Rows keyed by table, with the person itself under "resume", or
+        None if the document is not a valid anketa.
+    """
     try:
-        anketa = AnketaSchemaJson(**data).dict()
+        anketa = AnketaSchemaJson.model_validate_json(data).model_dump()
         anketa["resume"] = {
             "region": session["user"]["region"],
             "surname": anketa.pop("surname", "").upper(),
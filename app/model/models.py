@@ -1,7 +1,7 @@
 from datetime import date
 from typing import Optional, Union
 
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 from ..classes.classes import (
     Affiliates,
@@ -14,10 +14,9 @@ from ..classes.classes import (
 
 
 class QueryModel(BaseModel):
-    id: Optional[str | int] = None
+    model_config = ConfigDict(use_enum_values=True)
 
-    class Config:
-        use_enum_values = True
+    id: Optional[str | int] = None
 
 
 class User(QueryModel):
@@ -32,7 +31,8 @@ class Name(QueryModel):
     firstname: str
     patronymic: Optional[str] = None
 
-    @validator("surname", "firstname", "patronymic")
+    @field_validator("surname", "firstname", "patronymic")
+    @classmethod
     def check_names(cls, v):
         return v.upper().strip() if v else None
 
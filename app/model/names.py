@@ -0,0 +1,128 @@
+import re
+
+SEPARATORS = re.compile(r"[\s\-‐‑–—]+")
+CYRILLIC = re.compile(r"[А-ЯЁ]")
+HOMOGLYPHS = str.maketrans("ABCEHKMOPTXY", "АВСЕНКМОРТХУ")
+QUOTES = re.compile(r"[\"'«»“”„`]")
+LEGAL_FORMS = re.compile(
+    r"\b(?:ООО|ОАО|ЗАО|ПАО|НАО|АО|ИП|ФГУП|ГУП|МУП|ФГБУ|ГБУ|АНО|"
+    r"ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ|"
+    r"(?:НЕ)?ПУБЛИЧНОЕ АКЦИОНЕРНОЕ ОБЩЕСТВО|АКЦИОНЕРНОЕ ОБЩЕСТВО|"
+    r"ИНДИВИДУАЛЬНЫЙ ПРЕДПРИНИМАТЕЛЬ)\b"
+)
+INN_NUMBER = re.compile(r"(?<!\d)(?:\d{12}|\d{10})(?!\d)")
+TRANSLIT = str.maketrans(
+    {
+        "А": "A",
+        "Б": "B",
+        "В": "V",
+        "Г": "G",
+        "Д": "D",
+        "Е": "E",
+        "Ж": "ZH",
+        "З": "Z",
+        "И": "I",
+        "Й": "I",
+        "К": "K",
+        "Л": "L",
+        "М": "M",
+        "Н": "N",
+        "О": "O",
+        "П": "P",
+        "Р": "R",
+        "С": "S",
+        "Т": "T",
+        "У": "U",
+        "Ф": "F",
+        "Х": "KH",
+        "Ц": "TS",
+        "Ч": "CH",
+        "Ш": "SH",
+        "Щ": "SHCH",
+        "Ъ": "IE",
+        "Ы": "Y",
+        "Ь": "",
+        "Э": "E",
+        "Ю": "IU",
+        "Я": "IA",
+    }
+)
+
+
+def normalize_name(value, translit=False):
+    """
+    Bring a surname, first name or patronymic to the form used for matching.
+
+    The name is upper-cased, Ё becomes Е and runs of spaces and hyphens become
+    one space. Latin letters that look like Cyrillic ones are replaced in
+    names written in Cyrillic, so a mistyped "ИВAНОВ" matches "ИВАНОВ".
+
+    Args:
+        value (str): The name as entered.
+        translit (bool): Transliterate the result to Latin letters as in
+                         passports, so "ИВАНОВ" and "IVANOV" match too.
+
+    Returns:
+        str: The normalized name, or None for an empty one.
+    """
+    if not value:
+        return None
+    value = SEPARATORS.sub(" ", value.upper().replace("Ё", "Е")).strip()
+    if CYRILLIC.search(value):
+        value = value.translate(HOMOGLYPHS)
+    if translit:
+        value = value.translate(TRANSLIT)
+    return value or None
+
+
+def normalize_organization(value):
+    """
+    Bring an organization name to the form used for cross-references.
+
+    Besides the folding of normalize_name, quotes and legal forms such as
+    ООО or АО are dropped, so «Вектор», ООО "Вектор" and ООО Вектор match.
+
+    Args:
+        value (str): The organization name as entered.
+
+    Returns:
+        str: The normalized name, or None for an empty one.
+    """
+    if not value:
+        return None
+    value = QUOTES.sub(" ", value.upper().replace("Ё", "Е"))
+    value = LEGAL_FORMS.sub(" ", " ".join(value.split()))
+    value = " ".join(value.split())
+    if CYRILLIC.search(value):
+        value = value.translate(HOMOGLYPHS)
+    return value or None
+
+
+def find_inns(value):
+    """
+    Find taxpayer numbers in free text.
+
+    Args:
+        value (str): A field that may contain 10 or 12 digit INNs.
+
+    Returns:
+        set: The INNs found.
+    """
+    return set(INN_NUMBER.findall(value or ""))
+
+
+def name_prefix(column, prefix):
+    """
+    Match names starting with `prefix` by a range an index can serve.
+
+    LIKE 'prefix%' is not served by a plain index in SQLite, a comparison
+    with the prefix and the prefix followed by the largest code point is.
+
+    Args:
+        column: The normalized name column.
+        prefix (str): The normalized beginning of the name.
+
+    Returns:
+        The SQL condition.
+    """
+    return (column >= prefix) & (column < prefix + "\U0010ffff")
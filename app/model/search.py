@@ -0,0 +1,180 @@
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import Date, text
+
+from .tables import db_session, engine
+
+SEARCH_FIELDS = {
+    "checks": ("courts", "internet", "comment"),
+    "investigations": ("info",),
+    "inquiries": ("info",),
+    "poligrafs": ("results",),
+}
+SLOTS = [(item, field) for item, fields in SEARCH_FIELDS.items() for field in fields]
+SLOT_SIZE = 16
+WORDS = re.compile(r"\w+")
+
+
+def fold(value):
+    return value.replace("ё", "е").replace("Ё", "Е")
+
+
+def row_id(item, item_id, field):
+    """
+    The FTS rowid of a field, derived from the source row.
+
+    Deterministic rowids let a row be reindexed or removed by rowid instead
+    of scanning the UNINDEXED columns.
+    """
+    return int(item_id) * SLOT_SIZE + SLOTS.index((item, field))
+
+
+def create_search_index():
+    """
+    Create the dossier_fts full-text table if the database has none.
+
+    Returns:
+        bool: True if the table was created and has to be filled.
+    """
+    with engine.begin() as connection:
+        if connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'dossier_fts'")
+        ).first():
+            return False
+        connection.execute(
+            text(
+                "CREATE VIRTUAL TABLE dossier_fts USING fts5("
+                "body, source UNINDEXED, source_id UNINDEXED, field UNINDEXED, "
+                "person_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        )
+    return True
+
+
+def unindex_text(item, item_id):
+    """
+    Remove the indexed fields of a row, in the current transaction.
+
+    Args:
+        item (str): The table of the row.
+        item_id (int): The ID of the row.
+    """
+    if item == "persons":
+        db_session.execute(
+            text("DELETE FROM dossier_fts WHERE person_id = :person_id"),
+            {"person_id": item_id},
+        )
+    elif item in SEARCH_FIELDS:
+        db_session.execute(
+            text("DELETE FROM dossier_fts WHERE rowid = :rowid"),
+            [{"rowid": row_id(item, item_id, f)} for f in SEARCH_FIELDS[item]],
+        )
+
+
+def index_text(item, row):
+    """
+    Reindex the narrative fields of a saved row, in the current transaction.
+
+    Args:
+        item (str): The table of the row.
+        row: The flushed model instance.
+    """
+    if item not in SEARCH_FIELDS:
+        return
+    unindex_text(item, row.id)
+    values = [
+        {
+            "rowid": row_id(item, row.id, field),
+            "body": fold(getattr(row, field)),
+            "source": item,
+            "source_id": int(row.id),
+            "field": field,
+            "person_id": row.person_id,
+        }
+        for field in SEARCH_FIELDS[item]
+        if getattr(row, field)
+    ]
+    if values:
+        db_session.execute(
+            text(
+                "INSERT INTO dossier_fts "
+                "(rowid, body, source, source_id, field, person_id) "
+                "VALUES (:rowid, :body, :source, :source_id, :field, :person_id)"
+            ),
+            values,
+        )
+
+
+def rebuild_search_index():
+    """
+    Refill dossier_fts from the source tables.
+
+    Returns:
+        int: The number of indexed fields.
+    """
+    create_search_index()
+    db_session.execute(text("DELETE FROM dossier_fts"))
+    for slot, (item, field) in enumerate(SLOTS):
+        db_session.execute(
+            text(
+                "INSERT INTO dossier_fts "
+                "(rowid, body, source, source_id, field, person_id) "
+                f"SELECT id * {SLOT_SIZE} + {slot}, "
+                f"replace(replace({field}, 'ё', 'е'), 'Ё', 'Е'), "
+                f"'{item}', id, '{field}', person_id FROM {item} "
+                f"WHERE {field} IS NOT NULL AND {field} != ''"
+            )
+        )
+    db_session.execute(
+        text("INSERT INTO dossier_fts (dossier_fts) VALUES ('optimize')")
+    )
+    count = db_session.execute(text("SELECT count(*) FROM dossier_fts")).scalar()
+    db_session.commit()
+    return count
+
+
+def search_text(query, region=None, limit=50):
+    """
+    Find dossier fields containing every word of the query.
+
+    Words match as prefixes, so "банкрот" finds "банкротстве". The best
+    matches by bm25 come first.
+
+    Args:
+        query (str): The words to look for.
+        region (str): Only return persons of this region.
+        limit (int): The maximum number of results.
+
+    Returns:
+        list: Dictionaries with the source row, the person and a snippet
+              with the matches wrapped in <mark>.
+    """
+    words = WORDS.findall(fold(query))
+    if not words:
+        return []
+    params = {"match": " ".join(f'"{word}"*' for word in words), "limit": limit}
+    where = "dossier_fts MATCH :match"
+    if region:
+        where += " AND persons.region = :region"
+        params["region"] = region
+    rows = db_session.execute(
+        text(
+            "SELECT dossier_fts.source, dossier_fts.source_id, dossier_fts.field, "
+            "persons.id, persons.surname, persons.firstname, persons.patronymic, "
+            "persons.birthday, persons.region, "
+            "snippet(dossier_fts, 0, char(2), char(3), '…', 16) AS snippet "
+            "FROM dossier_fts JOIN persons ON persons.id = dossier_fts.person_id "
+            f"WHERE {where} ORDER BY rank LIMIT :limit"
+        ).columns(birthday=Date),
+        params,
+    ).all()
+    result = []
+    for row in rows:
+        snippet = (
+            escape(row.snippet)
+            .replace("\x02", Markup("<mark>"))
+            .replace("\x03", Markup("</mark>"))
+        )
+        result.append(row._asdict() | {"snippet": snippet})
+    return result
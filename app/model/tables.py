@@ -1,3 +1,4 @@
+from collections import Counter
 from datetime import date, datetime
 from typing import List, Optional
 
@@ -6,12 +7,21 @@ from sqlalchemy import (
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
     create_engine,
+    event,
     func,
+    inspect,
+    delete,
+    insert,
+    select,
+    text,
+    update,
 )
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
@@ -20,7 +30,10 @@ from sqlalchemy.orm import (
     scoped_session,
     sessionmaker,
 )
+from sqlalchemy.schema import CreateColumn
+
 from config import Config
+from .names import find_inns, normalize_name, normalize_organization
 
 
 class Base(DeclarativeBase):
@@ -69,6 +82,16 @@ class Users(Base):
 
 class Persons(Base):
     __tablename__ = "persons"
+    __table_args__ = (
+        Index(
+            "ix_persons_norm_names",
+            "norm_surname",
+            "norm_firstname",
+            "norm_patronymic",
+            "birthday",
+        ),
+        Index("ix_persons_last_check", "last_conclusion", "last_checked_at"),
+    )
 
     id: Mapped[int] = mapped_column(
         nullable=False, unique=True, primary_key=True, autoincrement=True
@@ -76,6 +99,9 @@ class Persons(Base):
     surname: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     firstname: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     patronymic: Mapped[str] = mapped_column(String(255), nullable=True, index=True)
+    norm_surname: Mapped[str] = mapped_column(String(255), nullable=True)
+    norm_firstname: Mapped[str] = mapped_column(String(255), nullable=True)
+    norm_patronymic: Mapped[str] = mapped_column(String(255), nullable=True)
     birthday: Mapped[date] = mapped_column(Date, nullable=False)
     birthplace: Mapped[str] = mapped_column(Text, nullable=True)
     citizenship: Mapped[str] = mapped_column(String(255), nullable=True)
@@ -88,10 +114,22 @@ class Persons(Base):
     created: Mapped[datetime] = mapped_column(
         DateTime, default=func.now(), onupdate=func.now(), nullable=True
     )
-    region: Mapped[str] = mapped_column(String(255), nullable=True)
-    isbusy: Mapped[bool] = mapped_column(Boolean(), default=False)
+    # created moves on every edit, registered keeps when the person was added
+    registered: Mapped[datetime] = mapped_column(
+        DateTime, default=func.now(), nullable=True
+    )
+    region: Mapped[str] = mapped_column(
+        String(255), nullable=True, active_history=True
+    )
+    isbusy: Mapped[bool] = mapped_column(
+        Boolean(), default=False, active_history=True
+    )
     user_id: Mapped[Optional[int]] = mapped_column(
-        ForeignKey("users.id"), nullable=True
+        ForeignKey("users.id"), nullable=True, active_history=True
+    )
+    last_conclusion: Mapped[str] = mapped_column(String(255), nullable=True)
+    last_checked_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=True, index=True
     )
     previous: Mapped[List["Previous"]] = relationship(
         back_populates="persons", cascade="all, delete, delete-orphan"
@@ -137,6 +175,9 @@ class Persons(Base):
 
 class Previous(Base):
     __tablename__ = "previous"
+    __table_args__ = (
+        Index("ix_previous_norm_names", "norm_surname", "norm_firstname"),
+    )
 
     id: Mapped[int] = mapped_column(
         nullable=False, unique=True, primary_key=True, autoincrement=True
@@ -144,6 +185,9 @@ class Previous(Base):
     surname: Mapped[str] = mapped_column(String(255), nullable=True)
     firstname: Mapped[str] = mapped_column(String(255), nullable=True)
     patronymic: Mapped[str] = mapped_column(String(255), nullable=True)
+    norm_surname: Mapped[str] = mapped_column(String(255), nullable=True)
+    norm_firstname: Mapped[str] = mapped_column(String(255), nullable=True)
+    norm_patronymic: Mapped[str] = mapped_column(String(255), nullable=True)
     changed: Mapped[str] = mapped_column(String(255), nullable=True)
     reason: Mapped[str] = mapped_column(Text, nullable=True)
     created: Mapped[datetime] = mapped_column(
@@ -294,11 +338,11 @@ class Relations(Base):
         nullable=False, unique=True, primary_key=True, autoincrement=True
     )
     relation: Mapped[str] = mapped_column(String(255), nullable=True)
-    relation_id: Mapped[int] = mapped_column(Integer(), nullable=True)
+    relation_id: Mapped[int] = mapped_column(Integer(), nullable=True, index=True)
     created: Mapped[datetime] = mapped_column(
         DateTime, default=func.now(), onupdate=func.now(), nullable=True
     )
-    person_id: Mapped[int] = mapped_column(ForeignKey("persons.id"))
+    person_id: Mapped[int] = mapped_column(ForeignKey("persons.id"), index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     persons: Mapped[List["Persons"]] = relationship(back_populates="relations")
     users: Mapped[List["Users"]] = relationship(back_populates="relations")
@@ -395,6 +439,46 @@ class Inquiries(Base):
     users: Mapped[List["Users"]] = relationship(back_populates="inquiries")
 
 
+class Events(Base):
+    __tablename__ = "events"
+    # ids must not be reused once old events are pruned, the SSE streams
+    # resume after the last id they have seen
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id: Mapped[int] = mapped_column(
+        nullable=False, unique=True, primary_key=True, autoincrement=True
+    )
+    person_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    event: Mapped[str] = mapped_column(String(255), nullable=False)
+    created: Mapped[datetime] = mapped_column(
+        DateTime, default=func.now(), nullable=True, index=True
+    )
+
+
+class Organizations(Base):
+    __tablename__ = "organizations"
+    __table_args__ = (Index("ix_organizations_source", "source", "source_id"),)
+
+    id: Mapped[int] = mapped_column(
+        nullable=False, unique=True, primary_key=True, autoincrement=True
+    )
+    organization: Mapped[str] = mapped_column(Text, nullable=True)
+    norm_name: Mapped[str] = mapped_column(String(255), nullable=True, index=True)
+    inn: Mapped[str] = mapped_column(String(12), nullable=True, index=True)
+    source: Mapped[str] = mapped_column(String(255), nullable=False)
+    source_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    person_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+
+
+class Counters(Base):
+    __tablename__ = "counters"
+
+    scope: Mapped[str] = mapped_column(String(255), primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 tables_models = {
     "persons": Persons,
     "previous": Previous,
@@ -412,6 +496,401 @@ tables_models = {
     "inquiries": Inquiries,
 }
 
+# the person timeline reads the newest rows of every child table of a person
+for name, model in tables_models.items():
+    if name != "persons":
+        Index(f"ix_{name}_person_created", model.person_id, model.created)
+
+NAMES = ("surname", "firstname", "patronymic")
+
+
+@event.listens_for(Persons, "before_insert")
+@event.listens_for(Persons, "before_update")
+@event.listens_for(Previous, "before_insert")
+@event.listens_for(Previous, "before_update")
+def normalize_names(mapper, connection, target):
+    for name in NAMES:
+        value = normalize_name(getattr(target, name), Config.NAMES_TRANSLIT)
+        setattr(target, "norm_" + name, value)
+
+
+def organization_rows(source, row):
+    """
+    Build the organizations index rows of an affiliation, workplace or check.
+
+    Args:
+        source (str): The table of the row.
+        row: The model instance or a result row with its columns.
+
+    Returns:
+        list: Dictionaries for Organizations.
+    """
+    if source == "affilations":
+        names = [(row.organization, inn) for inn in find_inns(row.inn)] or [
+            (row.organization, None)
+        ]
+    elif source == "workplaces":
+        names = [(row.workplace, None)]
+    else:
+        names = [(None, inn) for inn in find_inns(row.inn)]
+    return [
+        {
+            "organization": organization,
+            "norm_name": normalize_organization(organization),
+            "inn": inn,
+            "source": source,
+            "source_id": row.id,
+            "person_id": row.person_id,
+        }
+        for organization, inn in names
+        if normalize_organization(organization) or inn
+    ]
+
+
+@event.listens_for(Affilations, "after_insert")
+@event.listens_for(Affilations, "after_update")
+@event.listens_for(Workplaces, "after_insert")
+@event.listens_for(Workplaces, "after_update")
+@event.listens_for(Checks, "after_insert")
+@event.listens_for(Checks, "after_update")
+def index_organizations(mapper, connection, target):
+    unindex_organizations(mapper, connection, target)
+    rows = organization_rows(mapper.local_table.name, target)
+    if rows:
+        connection.execute(Organizations.__table__.insert(), rows)
+
+
+@event.listens_for(Affilations, "after_delete")
+@event.listens_for(Workplaces, "after_delete")
+@event.listens_for(Checks, "after_delete")
+def unindex_organizations(mapper, connection, target):
+    table = Organizations.__table__
+    connection.execute(
+        table.delete().where(
+            table.c.source == mapper.local_table.name, table.c.source_id == target.id
+        )
+    )
+
+
+def rebuild_organizations():
+    """
+    Recreate the organizations index from affiliations, workplaces and checks.
+
+    Returns:
+        int: The number of index rows.
+    """
+    db_session.execute(delete(Organizations))
+    rows = []
+    for model, columns in (
+        (Affilations, ("organization", "inn")),
+        (Workplaces, ("workplace",)),
+        (Checks, ("inn",)),
+    ):
+        stmt = select(
+            model.id, model.person_id, *(getattr(model, name) for name in columns)
+        )
+        for row in db_session.execute(stmt):
+            rows.extend(organization_rows(model.__tablename__, row))
+    if rows:
+        db_session.execute(insert(Organizations), rows)
+    db_session.commit()
+    return len(rows)
+
+
+def person_counters(isbusy, user_id, region, unchecked):
+    """The counters a person with these values is counted in."""
+    keys = []
+    if isbusy and user_id:
+        keys.append(("user", str(user_id), "busy"))
+    if isbusy:
+        keys.append(("region", region or "", "pending"))
+    if unchecked:
+        keys.append(("region", region or "", "unchecked"))
+    return keys
+
+
+def add_counters(connection, added=(), removed=()):
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    rows = [
+        {"scope": scope, "key": key, "name": name, "value": value}
+        for (scope, key, name), value in deltas.items()
+        if value
+    ]
+    if rows:
+        stmt = sqlite_insert(Counters.__table__)
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["scope", "key", "name"],
+                set_={"value": Counters.__table__.c.value + stmt.excluded.value},
+            ),
+            rows,
+        )
+
+
+def has_checks(connection, person_id):
+    stmt = select(Checks.id).where(Checks.person_id == person_id).limit(1)
+    return connection.scalar(stmt) is not None
+
+
+@event.listens_for(Persons, "after_insert")
+def count_person(mapper, connection, target):
+    add_counters(
+        connection,
+        person_counters(target.isbusy, target.user_id, target.region, True),
+    )
+
+
+@event.listens_for(Persons, "after_update")
+def recount_person(mapper, connection, target):
+    state = inspect(target)
+    old, new = [], []
+    for name in ("isbusy", "user_id", "region"):
+        history = state.attrs[name].history
+        new.append(getattr(target, name))
+        old.append(history.deleted[0] if history.deleted else new[-1])
+    if old != new:
+        unchecked = not has_checks(connection, target.id)
+        add_counters(
+            connection,
+            person_counters(*new, unchecked),
+            person_counters(*old, unchecked),
+        )
+
+
+@event.listens_for(Persons, "after_delete")
+def uncount_person(mapper, connection, target):
+    add_counters(
+        connection,
+        removed=person_counters(
+            target.isbusy,
+            target.user_id,
+            target.region,
+            not has_checks(connection, target.id),
+        ),
+    )
+
+
+def check_region(connection, person_id):
+    """The region of a person and the number of their checks."""
+    checks = select(func.count(Checks.id)).where(Checks.person_id == person_id)
+    return connection.execute(
+        select(Persons.region, checks.scalar_subquery()).where(
+            Persons.id == person_id
+        )
+    ).first()
+
+
+@event.listens_for(Checks, "after_insert")
+def count_check(mapper, connection, target):
+    row = check_region(connection, target.person_id)
+    if row and row[1] == 1:
+        add_counters(connection, removed=[("region", row[0] or "", "unchecked")])
+
+
+@event.listens_for(Checks, "after_delete")
+def uncount_check(mapper, connection, target):
+    row = check_region(connection, target.person_id)
+    if row and row[1] == 0:
+        add_counters(connection, added=[("region", row[0] or "", "unchecked")])
+
+
+def last_check_update():
+    """
+    An UPDATE of persons that copies the newest check of every person.
+
+    The created column is written back unchanged, so recording a check does
+    not count as an edit of the person.
+    """
+    table = Persons.__table__
+    latest = {
+        name: select(getattr(Checks, column))
+        .where(Checks.person_id == table.c.id)
+        .order_by(Checks.id.desc())
+        .limit(1)
+        .scalar_subquery()
+        for name, column in (
+            ("last_conclusion", "conclusion"),
+            ("last_checked_at", "created"),
+        )
+    }
+    return update(table).values(**latest, created=table.c.created)
+
+
+@event.listens_for(Checks, "after_insert")
+@event.listens_for(Checks, "after_update")
+@event.listens_for(Checks, "after_delete")
+def update_last_check(mapper, connection, target):
+    connection.execute(
+        last_check_update().where(Persons.__table__.c.id == target.person_id)
+    )
+
+
+def backfill_last_checks(full=False):
+    """
+    Fill the newest check columns of persons checked before they existed.
+
+    Args:
+        full (bool): Recompute every person instead of the unfilled ones.
+
+    Returns:
+        int: The number of updated persons.
+    """
+    stmt = last_check_update()
+    if not full:
+        table = Persons.__table__
+        stmt = stmt.where(
+            table.c.last_checked_at.is_(None),
+            select(Checks.id).where(Checks.person_id == table.c.id).exists(),
+        )
+    updated = db_session.execute(stmt).rowcount
+    db_session.commit()
+    return updated
+
+
+def backfill_registered():
+    """
+    Fill the registration time of persons added before it was kept.
+
+    Their created time may have moved with later edits, so the earliest of it
+    and the creation of the rows of their dossier is taken.
+
+    Returns:
+        int: The number of updated persons.
+    """
+    table = Persons.__table__
+    earliest = [
+        func.coalesce(
+            select(func.min(model.created))
+            .where(model.person_id == table.c.id)
+            .scalar_subquery(),
+            table.c.created,
+        )
+        for name, model in tables_models.items()
+        if name != "persons"
+    ]
+    updated = db_session.execute(
+        update(table)
+        .where(table.c.registered.is_(None))
+        .values(
+            registered=func.min(table.c.created, *earliest), created=table.c.created
+        )
+    ).rowcount
+    db_session.commit()
+    return updated
+
+
+def rebuild_counters():
+    """
+    Recount the dashboard counters from persons and checks.
+
+    Returns:
+        int: The number of counters.
+    """
+    db_session.execute(delete(Counters))
+    unchecked = ~select(Checks.id).where(Checks.person_id == Persons.id).exists()
+    rows = []
+    busy = Persons.isbusy & Persons.user_id.is_not(None)
+    for scope, column, name, condition in (
+        ("user", Persons.user_id, "busy", busy),
+        ("region", Persons.region, "pending", Persons.isbusy),
+        ("region", Persons.region, "unchecked", unchecked),
+    ):
+        stmt = select(column, func.count(Persons.id)).where(condition).group_by(column)
+        for key, value in db_session.execute(stmt):
+            key = "" if key is None else str(key)
+            rows.append({"scope": scope, "key": key, "name": name, "value": value})
+    if rows:
+        db_session.execute(insert(Counters), rows)
+    db_session.commit()
+    return len(rows)
+
+
+def backfill_names(full=False, batch=1000):
+    """
+    Fill the normalized name columns of rows written without the ORM.
+
+    Args:
+        full (bool): Recompute every row, needed after NAMES_TRANSLIT changes.
+        batch (int): The number of rows updated per statement.
+
+    Returns:
+        int: The number of updated rows.
+    """
+    updated = 0
+    for model in (Persons, Previous):
+        # created is passed back unchanged, or onupdate would set it to now
+        stmt = select(
+            model.id, model.created, *(getattr(model, name) for name in NAMES)
+        )
+        if not full:
+            stmt = stmt.where(model.norm_surname.is_(None), model.surname.is_not(None))
+        rows = db_session.execute(stmt).all()
+        for start in range(0, len(rows), batch):
+            db_session.execute(
+                update(model),
+                [
+                    {"id": row.id, "created": row.created}
+                    | {
+                        "norm_" + name: normalize_name(
+                            getattr(row, name), Config.NAMES_TRANSLIT
+                        )
+                        for name in NAMES
+                    }
+                    for row in rows[start : start + batch]
+                ],
+            )
+            db_session.commit()
+        updated += len(rows)
+    return updated
+
+
+def add_missing_columns():
+    """
+    Add columns declared on the models to tables created by older versions.
+
+    create_all only creates missing tables, so new nullable columns are added
+    to existing ones with ALTER TABLE.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.execute(
+                        text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                    )
+
+
+def autoincrement_events():
+    """
+    Recreate an events table created without AUTOINCREMENT.
+
+    SQLite reuses the ids of deleted rows without it, so the events after a
+    prune were never delivered. The kept events are copied over and continue
+    the id sequence.
+    """
+    with engine.begin() as connection:
+        ddl = connection.scalar(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": Events.__tablename__},
+        )
+        if "AUTOINCREMENT" in ddl.upper():
+            return
+        rows = [row._asdict() for row in connection.execute(select(Events.__table__))]
+        Events.__table__.drop(connection)
+        Events.__table__.create(connection)
+        if rows:
+            connection.execute(insert(Events.__table__), rows)
+
+
 engine = create_engine(Config.DATABASE_URI)
 db_session = scoped_session(sessionmaker(autoflush=False, bind=engine))
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
+autoincrement_events()
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,47 @@
+from flask import Blueprint, Response, request, session
+
+from ..classes.classes import Roles
+from ..depends.metrics import render_metrics
+from ..handlers.handler import handle_login, password_expired
+from ..model.tables import db_session
+
+bp = Blueprint("metrics", __name__)
+
+
+def is_admin():
+    """
+    Check for an administrator session or HTTP Basic credentials of an
+    administrator, so that Prometheus can scrape with basic_auth.
+
+    The credentials are checked like on the login page: failed attempts
+    count towards blocking, and a password that must be changed is refused.
+    """
+    if session.get("user", {}).get("role") == Roles.admin.value:
+        return True
+    auth = request.authorization
+    if not auth or auth.type != "basic":
+        return False
+    user, error = handle_login(auth.username, auth.password)
+    if error or user.role != Roles.admin.value or password_expired(user):
+        return False
+    if user.attempt:
+        user.attempt = 0
+        db_session.commit()
+    return True
+
+
+@bp.get("/metrics")
+def get_metrics():
+    """
+    Exposes application metrics in the Prometheus text format.
+
+    Returns:
+        The metrics page, or 401 for anyone but administrators.
+    """
+    if not is_admin():
+        return Response(
+            "Unauthorized", 401, {"WWW-Authenticate": 'Basic realm="metrics"'}
+        )
+    return Response(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
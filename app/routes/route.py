@@ -1,11 +1,13 @@
-import json
+import csv
+import io
 import os
 import re
 import shutil
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from flask import (
     Blueprint,
+    Response,
     abort,
     current_app,
     flash,
@@ -14,23 +16,45 @@ from flask import (
     request,
     send_file,
     session,
+    stream_template,
 )
 from sqlalchemy import desc, func, select
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.security import generate_password_hash
 
-from ..classes.classes import Regions, Roles
-from ..depends.depend import login_required, roles_required
+from ..classes.classes import Conclusions, Regions, Roles
+from ..depends.depend import login_required, query_budget, roles_required
+from ..depends.events import broker, event_stream, notify_person
 from ..handlers.handler import (
+    TIMELINE,
+    ProfileItems,
+    facet_conditions,
+    handle_counters,
+    handle_facets,
     handle_get_item,
     handle_image,
     handle_json_to_dict,
+    handle_login,
+    handle_organization_links,
+    handle_persons_names,
+    handle_persons_filters,
     handle_post_item,
+    handle_relations_graph,
     handle_take_resume,
+    handle_timeline,
+    handle_turnaround,
     handle_users,
     make_destination,
+    password_expired,
 )
 from ..model.models import Person, User, models_tables
-from ..model.tables import Checks, Persons, Users, db_session, tables_models
+from ..model.search import search_text, unindex_text
+from ..model.tables import (
+    Checks,
+    Persons,
+    Users,
+    db_session,
+    tables_models,
+)
 
 bp = Blueprint("route", __name__)
 
@@ -43,7 +67,7 @@ def get_auth():
     Returns:
         A rendered HTML template for the auth page.
     """
-    return render_template("/login/auth.html.jinja")
+    return render_template("login/auth.html.jinja")
 
 
 @bp.route("/auth/<action>", methods=["GET", "POST"])
@@ -59,24 +83,13 @@ def login(action):
     """
     if request.method == "GET":
         if action == "login":
-            return render_template("/login/login.html.jinja")
+            return render_template("login/login.html.jinja")
         else:
-            return render_template("/login/password.html.jinja")
+            return render_template("login/password.html.jinja")
     else:
-        user = db_session.execute(
-            select(Users).where(Users.username == request.form.get("login"))
-        ).scalar_one_or_none()
-        if not user or user.blocked or user.deleted:
-            flash("Полььзователь не найден или заблокирован", "danger")
-            return redirect("/auth")
-
-        if not check_password_hash(user.passhash, request.form["password"]):
-            if user.attempt < 5:
-                user.attempt += 1
-            else:
-                user.blocked = True
-            db_session.commit()
-            flash("Неверный логин или пароль", "danger")
+        user, error = handle_login(request.form.get("login"), request.form["password"])
+        if error:
+            flash(error, "danger")
             return redirect("/auth")
 
         if action == "password":
@@ -98,8 +111,7 @@ def login(action):
             flash("Новый пароль не соответствует требованиям", "danger")
             return redirect("/auth")
 
-        delta_change = datetime.now() - user.pswd_create
-        if not user.change_pswd and delta_change.days < 365:
+        if not password_expired(user):
             session["user"] = user.to_dict()
             user.attempt = 0
             db_session.commit()
@@ -148,8 +160,8 @@ def take_users():
     users = db_session.execute(stmt.order_by(desc(Users.id))).scalars()
     result = [user.to_dict() for user in users]
     if request.method == "POST":
-        return render_template("/users/info.html.jinja", users=result)
-    return render_template("/users/users.html.jinja", users=result)
+        return render_template("users/info.html.jinja", users=result)
+    return render_template("users/users.html.jinja", users=result)
 
 
 @bp.post("/user")
@@ -169,7 +181,7 @@ def post_user():
         A rendered HTML template with user data or an error message.
     """
     try:
-        json_dict = User(**request.form).dict()
+        json_dict = User.model_validate(request.form.to_dict()).model_dump()
         user = db_session.execute(
             select(Users).filter(Users.username == json_dict.get("username"))
         ).all()
@@ -181,11 +193,11 @@ def post_user():
             )
             db_session.add(Users(**json_dict))
             db_session.commit()
-            return render_template("/users/info.html.jinja", users=handle_users())
+            return render_template("users/info.html.jinja", users=handle_users())
         return abort(400)
     except Exception as e:
         print(e)
-        return render_template("/users/users.html.jinja", users=handle_users())
+        return render_template("users/users.html.jinja", users=handle_users())
 
 
 @bp.route("/user/<int:user_id>", methods=["GET", "POST"])
@@ -229,18 +241,32 @@ def take_user(user_id):
         elif "region" in item and item["region"] in [reg.value for reg in Regions]:
             user.region = item["region"]
     db_session.commit()
-    return render_template("/users/info.html.jinja", users=handle_users())
+    return render_template("users/info.html.jinja", users=handle_users())
 
 
 @bp.get("/")
 @login_required()
 def route_menu():
-    return render_template("/index.html.jinja")
+    return render_template("index.html.jinja")
+
+
+@bp.get("/dashboard")
+@login_required()
+@query_budget(1)
+def route_dashboard():
+    """
+    Renders the workload counters of the current user and region.
+
+    Returns:
+        A rendered HTML template with the counters.
+    """
+    return render_template("persons/dashboard.html.jinja", counters=handle_counters())
 
 
 @bp.get("/index")
 @bp.route("/index/<int:page>", methods=["GET", "POST"])
 @login_required()
+@query_budget(3)
 def route_personal(page=1):
     """
     Handles GET and POST requests to the /index/<int:page> endpoint for person management.
@@ -249,6 +275,10 @@ def route_personal(page=1):
     It checks if the current user is logged in and if the requested page number is valid.
     If the request method is GET, it updates the person's isbusy based on the provided query parameters.
     If the request method is POST, it searches for persons based on the provided form data.
+    The status, conclusion, checked_from and checked_to fields filter the persons by
+    their workload state and their latest check, kept on the persons table. The
+    region, user, busy, citizenship and period facets narrow the list further, and
+    the facet sidebar with the counts of every value is swapped in out of band.
     The function returns a rendered HTML template with the person data.
 
     Parameters:
@@ -258,29 +288,18 @@ def route_personal(page=1):
         A rendered HTML template with the person data.
     """
     if request.method == "GET":
-        return render_template("/persons/personal.html.jinja")
+        return render_template(
+            "persons/personal.html.jinja",
+            status=request.args.get("status"),
+            conclusions=[item.value for item in Conclusions],
+        )
 
     pagination = 12
-    stmt = select(Persons, Users.fullname)
-    search_data = request.form.get("search")
-    if search_data and len(search_data) > 2:
-        if search_data.isdigit():
-            stmt.filter(Persons.inn.ilike("%" + search_data + "%"))
-        else:
-            pattern = r"^\d{2}\.\d{2}\.\d{4}$"
-            query = list(map(str.upper, search_data.split()))
-            if len(query):
-                stmt = stmt.filter(Persons.surname.ilike(f"%{query[0]}%"))
-            if len(query) > 1 and not re.match(pattern, query[1]):
-                stmt = stmt.filter(Persons.firstname.ilike(f"%{query[1]}%"))
-            if len(query) > 2 and not re.match(pattern, query[2]):
-                stmt = stmt.filter(Persons.patronymic.ilike(f"%{query[2]}%"))
-            if len(query) > 1 and re.match(pattern, query[-1]):
-                stmt = stmt.filter(
-                    Persons.birthday == datetime.strptime(query[-1], "%d.%m.%Y").date()
-                )
-    if session["user"]["region"] != Regions.main.value:
-        stmt = stmt.filter(Persons.region == session["user"]["region"])
+    conditions, selected = handle_persons_filters(request.form)
+    facets = handle_facets(conditions, selected)
+    stmt = select(Persons, Users.fullname).where(
+        *conditions, *facet_conditions(selected)
+    )
     query = db_session.execute(
         stmt.join(Users)
         .order_by(desc(Persons.id))
@@ -291,15 +310,67 @@ def route_personal(page=1):
     has_next = len(result) > pagination
     result = result[:pagination] if has_next else result
 
-    return render_template(
-        "/persons/info.html.jinja",
+    return stream_template(
+        "persons/info.html.jinja",
         candidates=result,
         has_next=has_next,
         has_prev=page > 1,
         page=page,
+        facets=facets,
     )
 
 
+@bp.get("/person/<int:person_id>")
+@login_required()
+@query_budget(2)
+def route_person(person_id):
+    """
+    Renders a single row of the persons table, refreshed on person events.
+
+    Parameters:
+        person_id (int): The ID of the person.
+
+    Returns:
+        A rendered HTML template with the table row, empty if the person
+        does not exist or belongs to another region.
+    """
+    result = handle_get_item("persons", person_id)
+    if not result or (
+        session["user"]["region"] != Regions.main.value
+        and result["region"] != session["user"]["region"]
+    ):
+        return ""
+    return render_template("persons/row.html.jinja", item=result)
+
+
+@bp.get("/events")
+@login_required()
+def route_events():
+    """
+    Streams person events to the browser as server-sent events.
+
+    Returns:
+        A text/event-stream response, resumed from the Last-Event-ID header.
+    """
+    config = current_app.config
+    broker.start(config["SSE_POLL_INTERVAL"])
+    cursor = request.headers.get("Last-Event-ID", type=int, default=broker.last_id)
+    # an id newer than any event comes from before the table was recreated
+    cursor = min(cursor, broker.last_id)
+    response = Response(
+        event_stream(
+            cursor,
+            config["SSE_TIMEOUT"],
+            config["SSE_HEARTBEAT"],
+            config["SSE_MAX_STREAMS"],
+        ),
+        mimetype="text/event-stream",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 @bp.route("/resume", methods=["GET", "POST"])
 @roles_required(Roles.user.value)
 def take_resume():
@@ -315,18 +386,19 @@ def take_resume():
         A rendered template or a redirect response.
     """
     if request.method == "GET":
-        return render_template("/profile/create.html.jinja")
-    resume = Person(**request.form).dict()
+        return render_template("profile/create.html.jinja")
+    resume = Person.model_validate(request.form.to_dict()).model_dump()
     person_id = handle_take_resume(resume)
     if person_id:
         flash("Резюме успешно добавлено", "success")
     else:
         flash("Некорректные данные", "danger")
-    return render_template("/persons/personal.html.jinja")
+    return render_template("persons/personal.html.jinja")
 
 
 @bp.get("/profile/<int:person_id>")
 @login_required()
+@query_budget(20)
 def route_profile(person_id):
     """
     Retrieves a person's profile information.
@@ -335,15 +407,143 @@ def route_profile(person_id):
         person_id (int): The ID of the person for whom to retrieve the profile information.
 
     Returns:
-        A rendered template with the person's profile information.
+        A streamed template with the person's profile information.
     """
     standing = request.args.get("standing")
     if standing:
         person = db_session.get(Persons, person_id)
         person.isbusy = not person.isbusy
+        notify_person(person_id, "busy")
         db_session.commit()
-    result = {item: handle_get_item(item, person_id) for item in tables_models.keys()}
-    return render_template("profile/profile.html.jinja", person=result)
+    result = ProfileItems(person_id)
+    return stream_template("profile/profile.html.jinja", person=result)
+
+
+@bp.get("/relations/graph/<int:person_id>")
+@login_required()
+@query_budget(4)
+def route_relations_graph(person_id):
+    """
+    Renders the persons connected to a person through relations.
+
+    Parameters:
+        person_id (int): The ID of the person in the centre of the graph.
+
+    Returns:
+        A rendered HTML template with the connected persons by distance.
+    """
+    max_depth = current_app.config["RELATIONS_GRAPH_DEPTH"]
+    depth = min(max(request.args.get("depth", max_depth, type=int), 1), max_depth)
+    result = handle_relations_graph(person_id, depth)
+    return render_template(
+        "profile/divs/graph.html.jinja", nodes=result, depth=depth
+    )
+
+
+@bp.get("/timeline/<int:person_id>")
+@login_required()
+@query_budget(1)
+def route_timeline(person_id):
+    """
+    Renders a page of the changes to a person's dossier, newest first.
+
+    The stamp, item and id query parameters identify the last row of the
+    previous page.
+
+    Parameters:
+        person_id (int): The ID of the person.
+
+    Returns:
+        A rendered HTML template with the rows and a button for the next page.
+    """
+    stamp = request.args.get("stamp")
+    item = request.args.get("item")
+    item_id = request.args.get("id", type=int)
+    after = (stamp, item, item_id) if stamp and item in TIMELINE and item_id else None
+    events, after = handle_timeline(person_id, after)
+    return render_template(
+        "profile/divs/timeline.html.jinja",
+        person_id=person_id,
+        events=events,
+        after=after,
+    )
+
+
+@bp.get("/organizations")
+@login_required()
+@query_budget(2)
+def route_organizations():
+    """
+    Renders the persons tied to an organization.
+
+    The query parameter is an INN when it consists of digits and the
+    beginning of the organization name otherwise.
+
+    Returns:
+        A rendered HTML template with the linked persons.
+    """
+    query = request.args.get("query", "").strip()
+    if query.isdigit():
+        result = handle_organization_links(inn=query)
+    elif len(query) > 2:
+        result = handle_organization_links(name=query)
+    else:
+        result = []
+    return render_template(
+        "profile/divs/organizations.html.jinja", persons=result, query=query
+    )
+
+
+@bp.route("/search", methods=["GET", "POST"])
+@login_required()
+@query_budget(2)
+def route_search():
+    """
+    Searches the texts of checks, investigations, inquiries and polygraph
+    results.
+
+    A GET request renders the search page, a POST request renders the
+    matches of the query. Users outside the main office only find persons
+    of their region.
+
+    Returns:
+        A rendered HTML template with the search form or the matches.
+    """
+    if request.method == "GET":
+        return render_template("search/search.html.jinja")
+    region = session["user"]["region"]
+    result = search_text(
+        request.form.get("query", ""),
+        region=None if region == Regions.main.value else region,
+    )
+    return render_template(
+        "search/results.html.jinja",
+        results=result,
+        query=request.form.get("query", ""),
+    )
+
+
+@bp.get("/status/<int:person_id>")
+@login_required()
+@query_budget(2)
+def route_status(person_id):
+    """
+    Renders the editing status of a person's profile.
+
+    Parameters:
+        person_id (int): The ID of the person.
+
+    Returns:
+        A rendered HTML template with the status button, empty if the person
+        does not exist or belongs to another region.
+    """
+    result = handle_get_item("persons", person_id)
+    if not result or (
+        session["user"]["region"] != Regions.main.value
+        and result["region"] != session["user"]["region"]
+    ):
+        return ""
+    return render_template("profile/divs/status.html.jinja", person=result)
 
 
 @bp.post("/region/<int:person_id>")
@@ -369,8 +569,8 @@ def change_region(person_id):
             person.destination = destination
         person.region = region
         db_session.commit()
-        result = handle_get_item("persons", person_id)
-        return render_template("/profile/divs/persons.html.jinja", items=result)
+        result = person.to_dict() | {"username": person.users.fullname}
+        return render_template("profile/divs/persons.html.jinja", items=result)
     return abort(400)
 
 
@@ -394,10 +594,9 @@ def get_item_id(item, action, item_id):
         stmt = stmt.filter(tables_models[item].id == item_id)
         query = db_session.execute(stmt).one_or_none()
         result = query[0].to_dict() | {"username": query[1]}
-        print(result)
         return render_template(
             f"profile/forms/{item}.html.jinja",
-            id=result["id"] if item != "persons" else None,
+            id=result["person_id"] if item != "persons" else None,
             item=result,
         )
     results = handle_get_item(item, item_id)
@@ -406,6 +605,7 @@ def get_item_id(item, action, item_id):
 
 @bp.post("/<item>/<int:item_id>")
 @roles_required(Roles.user.value)
+@query_budget(8)
 def post_item_id(item, item_id):
     """
     Handles HTTP POST requests for a specific item by ID.
@@ -415,14 +615,27 @@ def post_item_id(item, item_id):
         item_id (int): The ID of the item being updated.
 
     Returns:
-        A rendered HTML template with the updated item information.
+        A rendered HTML template with the out-of-band swap of the saved card.
     """
 
     data = request.form
-    json_dict = models_tables[item](**data).dict()
-    handle_post_item(json_dict, item, item_id)
-    results = handle_get_item(item, item_id)
-    return render_template(f"profile/divs/{item}.html.jinja", items=results)
+    json_dict = models_tables[item].model_validate(data.to_dict()).model_dump()
+    if item == "checks":
+        notify_person(item_id, "check")
+    row = handle_post_item(json_dict, item, item_id)
+    if item == "persons":
+        results = handle_get_item(item, item_id)
+        return render_template("profile/divs/persons.html.jinja", items=results)
+    result = row.to_dict() | {"username": session["user"]["fullname"]}
+    if item == "relations":
+        result["related"] = handle_persons_names([row.relation_id]).get(
+            row.relation_id
+        )
+    return render_template(
+        f"profile/cards/{item}.html.jinja",
+        item=result,
+        action="update" if data.get("id") else "insert",
+    )
 
 
 @bp.get("/delete/<item>/<int:item_id>")
@@ -436,23 +649,24 @@ def delete_item(item, item_id):
         item_id (int): The ID of the item being deleted.
 
     Returns:
-        A rendered HTML template with the updated item information after deletion.
+        A rendered HTML template with the out-of-band removal of the card.
     """
 
     row = db_session.get(tables_models[item], item_id)
     if not row:
         return abort(400)
     db_session.delete(row)
+    unindex_text(item, item_id)
     db_session.commit()
     if item == "persons":
-        return render_template("/persons/personal.html.jinja")
-    results = handle_get_item(item, row.person_id)
+        return render_template("persons/personal.html.jinja")
     return render_template(
-        f"profile/divs/{item}.html.jinja", items=results, id=row.person_id
+        f"profile/cards/{item}.html.jinja", item={"id": item_id}, action="delete"
     )
 
 
 @bp.get("/image/<int:person_id>")
+@query_budget(1)
 def get_image(person_id):
     """
     Retrieves an image from the specified path and sends it as a response.
@@ -489,22 +703,21 @@ def post_file(item, item_id):
         return abort(400)
 
     if item == "anketa":
-        json_dict = json.load(files["json"])
-        anketa = handle_json_to_dict(json_dict)
+        anketa = handle_json_to_dict(files["json"].read())
         if not anketa:
             flash("Некорректные данные", "danger")
-            return render_template("/persons/personal.html.jinja")
+            return render_template("persons/personal.html.jinja")
         person_id = handle_take_resume(anketa["resume"])
         if not person_id:
             flash("Некорректные данные", "danger")
-            return render_template("/persons/personal.html.jinja")
+            return render_template("persons/personal.html.jinja")
         for table, contents in anketa.items():
             if contents and table != "resume":
                 for content in contents:
                     if content:
                         handle_post_item(content, table, person_id)
         flash("Резюме успешно добавлено", "success")
-        return render_template("/persons/personal.html.jinja")
+        return render_template("persons/personal.html.jinja")
 
     person = db_session.get(Persons, item_id)
     if not person:
@@ -530,7 +743,7 @@ def post_file(item, item_id):
         new_file = handle_image(files["image"], item_dir)
         if new_file:
             return render_template(
-                "/profile/divs/photo.html.jinja", person_id=person.id
+                "profile/divs/photo.html.jinja", person_id=person.id
             )
         else:
             return abort(400)
@@ -586,13 +799,67 @@ def take_info():
     ).all()
     if request.method == "GET":
         return render_template(
-            "/information/information.html.jinja",
-            results=[list(result) for result in results],
+            "information/information.html.jinja",
+            checks=[list(result) for result in results],
             start=datetime.strftime(start, "%Y-%m-%d"),
             end=datetime.strftime(end, "%Y-%m-%d"),
             region=region,
         )
     else:
         return render_template(
-            "/information/info.html.jinja", results=[list(result) for result in results]
+            "information/info.html.jinja", checks=[list(result) for result in results]
+        )
+
+
+@bp.get("/information/turnaround")
+@login_required()
+@query_budget(2)
+def route_turnaround():
+    """
+    Renders the percentiles of the check turnaround times.
+
+    The period, region and breakdown are taken from the query parameters,
+    by default the last 30 days of all regions broken down by region. Users
+    outside the main office only see their region. With export=csv the figures are
+    downloaded as a CSV file instead.
+
+    Returns:
+        A rendered HTML template with the percentiles or a CSV file.
+    """
+    end = request.args.get("end", type=date.fromisoformat) or date.today()
+    start = request.args.get("start", type=date.fromisoformat)
+    start = start or end - timedelta(days=30)
+    region = request.args.get("region") or None
+    if session["user"]["region"] != Regions.main.value:
+        region = session["user"]["region"]
+    group = request.args.get("group")
+    if group not in ("region", "user", "month"):
+        group = "region"
+    result = handle_turnaround(start, end, region, group)
+    if request.args.get("export") == "csv":
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["metric", group, "count", "p50", "p90", "p99"])
+        for row in result:
+            writer.writerow(
+                [row["metric"], row["key"], row["count"]]
+                + [round(row[name], 2) for name in ("p50", "p90", "p99")]
+            )
+        return Response(
+            "\ufeff" + output.getvalue(),
+            mimetype="text/csv",
+            headers={
+                "Content-Disposition": "attachment; "
+                f"filename=turnaround-{start}-{end}-{group}.csv"
+            },
         )
+    return render_template(
+        "information/turnaround.html.jinja",
+        rows=result,
+        params={
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "region": region or "",
+            "group": group,
+        },
+    )
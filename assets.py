@@ -0,0 +1,123 @@
+"""
+Front-end assets build.
+
+The pages load Bootstrap, bootstrap-icons and htmx from app/static/vendor,
+so they work in a closed network. The files are committed; on a version bump
+update the URLs and hashes below, then run on a machine with internet access
+and commit the result:
+
+    python assets.py fetch
+
+Precompressed gzip and brotli variants are build artifacts. Create them
+before packaging or deploying:
+
+    python assets.py build
+"""
+
+import base64
+import gzip
+import hashlib
+import os
+import sys
+import urllib.request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+STATIC_PATH = os.path.join(basedir, "app", "static")
+
+VENDOR = {
+    "vendor/bootstrap/bootstrap.min.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.8/dist/css/bootstrap.min.css",
+        "sha384-sRIl4kxILFvY47J16cr9ZwB07vP4J8+LH7qKQnuqkuIAvNWLzeN8tE5YBujZqJLB",
+    ),
+    "vendor/bootstrap/bootstrap.bundle.min.js": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.8/dist/js/bootstrap.bundle.min.js",
+        "sha384-FKyoEForCGlyvwx9Hj09JcYn3nv7wiPVlz7YYwJrWVcXK/BmnVDxM+D2scQbITxI",
+    ),
+    "vendor/bootstrap-icons/bootstrap-icons.min.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.min.css",
+        "sha384-XGjxtQfXaH2tnPFa9x+ruJTuLE3Aa6LhHSWRr1XeTyhezb4abCG4ccI5AkVDxqC+",
+    ),
+    "vendor/bootstrap-icons/fonts/bootstrap-icons.woff2": (
+        "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff2",
+        "sha384-QV+/zNG6sFIQ/qAWRxaR4sjpF37wr046d3pTS5QlogmJfbmyeiWip4YIIGmdK4pa",
+    ),
+    "vendor/bootstrap-icons/fonts/bootstrap-icons.woff": (
+        "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff",
+        "sha384-jiOBsoZ7OEMAq7BXRR05+D5H/5Lna7TAlXVGHhkfH68p5P1eKJTeI4KCIOfBzG/O",
+    ),
+    "vendor/htmx/htmx.min.js": (
+        "https://unpkg.com/htmx.org@2.0.4/dist/htmx.min.js",
+        "sha384-HGfztofotfshcF7+8n44JQL2oJmowVChPTg48S+jvZoztPfvwD79OC/LTtG6dMp+",
+    ),
+    "vendor/htmx/sse.js": (
+        "https://unpkg.com/htmx.org@2.0.4/dist/ext/sse.js",
+        "sha384-QA9wXqexhwzXTuTvuF5QP82pddm3R2hy81UzXi7ioNTqNF2b75hlkkSGjafohhL3",
+    ),
+}
+
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html")
+
+
+def fetch():
+    """
+    Download the pinned vendor files into app/static/vendor.
+
+    Files with a known subresource integrity hash are verified before they
+    are written.
+    """
+    for path, (url, integrity) in VENDOR.items():
+        with urllib.request.urlopen(url) as response:
+            content = response.read()
+        if integrity:
+            algorithm, expected = integrity.split("-", 1)
+            digest = base64.b64encode(hashlib.new(algorithm, content).digest())
+            if digest.decode() != expected:
+                raise ValueError(f"Integrity check failed for {url}")
+        file_path = os.path.join(STATIC_PATH, path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(content)
+        print(f"{path}: {len(content)} bytes")
+
+
+def build():
+    """
+    Write .gz and, if the brotli package is installed, .br variants next to
+    every compressible static file.
+    """
+    for root, _, files in os.walk(STATIC_PATH):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, "rb") as f:
+                content = f.read()
+            variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants[".br"] = brotli.compress(content, quality=11)
+            for suffix, compressed in variants.items():
+                with open(file_path + suffix, "wb") as f:
+                    f.write(compressed)
+            print(
+                os.path.relpath(file_path, STATIC_PATH),
+                len(content),
+                *(f"{suffix}={len(data)}" for suffix, data in variants.items()),
+            )
+
+
+commands = {
+    "fetch": fetch,
+    "build": build,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        commands[sys.argv[1]]()
+    else:
+        print("Usage: python assets.py [{}]".format("|".join(commands)))
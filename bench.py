@@ -0,0 +1,936 @@
+"""
+Benchmarks for the StaffSec application.
+
+Every benchmark runs against a throwaway database and file storage in a
+temporary directory, so it is safe to start next to a working installation.
+
+Usage:
+    python bench.py templates
+    python bench.py stream
+    python bench.py compress
+    python bench.py validation [ROUNDS]
+    python bench.py serve
+    python bench.py desktop
+    python bench.py scrape
+    python bench.py suite [PERSONS] [OUTPUT]
+    python bench.py load [CONCURRENCY] [DURATION] [WORKERS] [THREADS] [PERSONS]
+    python bench.py compare BASELINE.json RESULT.json
+"""
+
+import base64
+import io
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from datetime import date, datetime
+from http.cookiejar import CookieJar
+
+
+def make_config(workdir, **options):
+    from config import Config
+
+    class BenchConfig(Config):
+        BASE_PATH = os.path.join(workdir, "PersonalDB")
+        TEMPLATES_CACHE = os.path.join(workdir, "TemplatesCache")
+
+    for key, value in options.items():
+        setattr(BenchConfig, key, value)
+    return BenchConfig
+
+
+def open_app(workdir, **options):
+    os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    from app import create_app
+
+    return create_app(make_config(workdir, **options))
+
+
+def login(client, role="user"):
+    from app.classes.classes import Regions
+
+    with client.session_transaction() as sess:
+        sess["user"] = {
+            "id": 1,
+            "username": "superadmin",
+            "fullname": "Администратор",
+            "role": role,
+            "region": Regions.main.value,
+        }
+
+
+def templates_child(workdir, mode):
+    from app import create_app
+    from app.classes.classes import Regions
+    from app.model.tables import Persons, db_session
+
+    start = time.perf_counter()
+    app = create_app(
+        make_config(
+            workdir,
+            TEMPLATES_CACHE=(
+                None if mode == "cold" else os.path.join(workdir, "TemplatesCache")
+            ),
+            TEMPLATES_WARMUP=mode in ("prime", "warm"),
+        )
+    )
+    boot = time.perf_counter() - start
+
+    if not db_session.get(Persons, 1):
+        db_session.add(
+            Persons(
+                surname="ИВАНОВ",
+                firstname="ИВАН",
+                patronymic="ИВАНОВИЧ",
+                birthday=date(1990, 1, 1),
+                region=Regions.main.value,
+                user_id=1,
+            )
+        )
+        db_session.commit()
+        db_session.remove()
+
+    client = app.test_client()
+    login(client)
+    start = time.perf_counter()
+    client.get("/profile/1")
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    client.get("/profile/1")
+    second = time.perf_counter() - start
+    print(f"{boot:.4f} {first:.4f} {second:.4f}")
+
+
+def bench_templates():
+    """
+    Measure boot time and first /profile latency of a fresh worker process.
+
+    Modes:
+        cold:   no bytecode cache and no warm-up, every template is parsed
+                on the first request.
+        cached: bytecode cache populated by a previous process, templates
+                are loaded lazily on the first request.
+        warm:   bytecode cache plus warm-up at boot.
+
+    A priming process runs first to create the database and fill the cache.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        env = os.environ | {
+            "DATABASE_URI": "sqlite:///" + os.path.join(workdir, "bench.db")
+        }
+        print(f"{'mode':<8}{'boot, ms':>12}{'first, ms':>12}{'second, ms':>12}")
+        for mode in ("prime", "cold", "cached", "warm"):
+            output = subprocess.run(
+                [sys.executable, __file__, "templates-child", workdir, mode],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.split()
+            if mode == "prime":
+                continue
+            boot, first, second = (float(value) * 1000 for value in output[-3:])
+            print(f"{mode:<8}{boot:>12.1f}{first:>12.1f}{second:>12.1f}")
+
+
+def seed_dossier(rows):
+    """
+    Add a person with `rows` child rows split between workplaces, checks and
+    inquiries. Returns the person id.
+    """
+    from app.classes.classes import Conclusions, Regions
+    from app.model.tables import Checks, Inquiries, Persons, Workplaces, db_session
+
+    person = Persons(
+        surname="ИВАНОВ",
+        firstname="ИВАН",
+        patronymic="ИВАНОВИЧ",
+        birthday=date(1990, 1, 1),
+        region=Regions.main.value,
+        user_id=1,
+    )
+    db_session.add(person)
+    db_session.flush()
+    text = "Сведения не найдены. " * 20
+    for i in range(rows):
+        if i % 5 < 2:
+            row = Workplaces(
+                starts=date(2000 + i % 20, 1, 1),
+                workplace=f"ООО Организация {i}",
+                position="Специалист",
+                addresses=text,
+            )
+        elif i % 5 < 4:
+            row = Checks(
+                **{field: text for field in ("workplace", "document", "inn", "courts")},
+                conclusion=Conclusions.agreed.value,
+            )
+        else:
+            row = Inquiries(info=text, initiator="СБ", origins="Запрос")
+        row.person_id = person.id
+        row.user_id = 1
+        db_session.add(row)
+    db_session.commit()
+    person_id = person.id
+    db_session.remove()
+    return person_id
+
+
+def bench_stream(rows="500"):
+    """
+    Compare a buffered and a streamed /profile page of a synthetic dossier.
+
+    The dossier holds `rows` child rows split between workplaces, checks and
+    inquiries. Reports time to first byte, total time and peak Python memory.
+    """
+    rows = int(rows)
+    with tempfile.TemporaryDirectory() as workdir:
+        app = open_app(workdir)
+
+        from flask import render_template, session
+
+        from app.classes.classes import Regions
+        from app.handlers.handler import handle_get_item
+        from app.model.tables import db_session, tables_models
+
+        person_id = seed_dossier(rows)
+
+        user = {"id": 1, "role": "user", "region": Regions.main.value}
+        results = {}
+
+        tracemalloc.start()
+        with app.test_request_context():
+            session["user"] = user
+            start = time.perf_counter()
+            body = render_template(
+                "profile/profile.html.jinja",
+                person={item: handle_get_item(item, person_id) for item in tables_models},
+            )
+            total = time.perf_counter() - start
+        results["buffered"] = (total, total, tracemalloc.get_traced_memory()[1])
+        db_session.remove()
+        tracemalloc.stop()
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["user"] = user
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(f"/profile/{person_id}", buffered=False)
+        chunks = iter(response.response)
+        size = len(next(chunks))
+        first = time.perf_counter() - start
+        for chunk in chunks:
+            size += len(chunk)
+        total = time.perf_counter() - start
+        response.close()
+        results["streamed"] = (first, total, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        print(f"{rows} rows, {len(body) // 1024} KiB page")
+        print(f"{'mode':<10}{'ttfb, ms':>12}{'total, ms':>12}{'peak, KiB':>12}")
+        for mode, (first, total, peak) in results.items():
+            print(f"{mode:<10}{first * 1000:>12.1f}{total * 1000:>12.1f}{peak // 1024:>12}")
+
+
+def bench_compress(rows="50", bandwidth="2000000"):
+    """
+    Measure htmx fragment sizes and latency per content encoding.
+
+    Besides the server time, prints the transfer time of the body over a
+    link of `bandwidth` bits per second, such as a VPN to a regional office.
+    """
+    rows, bandwidth = int(rows), int(bandwidth)
+    with tempfile.TemporaryDirectory() as workdir:
+        app = open_app(workdir)
+        person_id = seed_dossier(rows)
+        client = app.test_client()
+        login(client)
+        urls = [
+            ("post", "/index/1"),
+            ("get", f"/profile/{person_id}"),
+            ("get", f"/checks/divs/{person_id}"),
+            ("get", f"/workplaces/divs/{person_id}"),
+        ]
+        print(f"{'url':<22}{'encoding':<10}{'bytes':>10}{'server, ms':>12}{'link, ms':>10}")
+        for method, url in urls:
+            for encoding in ("identity", "deflate", "gzip", "br"):
+                start = time.perf_counter()
+                response = getattr(client, method)(
+                    url, headers={"Accept-Encoding": encoding}
+                )
+                size = len(response.get_data())
+                server = time.perf_counter() - start
+                used = response.headers.get("Content-Encoding", "identity")
+                print(
+                    f"{url:<22}{used:<10}{size:>10}{server * 1000:>12.1f}"
+                    f"{size * 8 / bandwidth * 1000:>10.1f}"
+                )
+
+
+def bench_validation(rounds="2000"):
+    """
+    Measure validation throughput of form saves and anketa uploads.
+
+    Compares the Pydantic v1 style calls (constructor plus .dict(), the
+    anketa parsed with json.loads first) to model_validate and
+    model_validate_json on the raw bytes.
+    """
+    import warnings
+
+    from seed import make_anketa
+
+    rounds = int(rounds)
+    with tempfile.TemporaryDirectory() as workdir:
+        open_app(workdir)
+        from app.model.models import AnketaSchemaJson, Check, Person
+
+        check = {
+            "workplace": "Проверка по местам работы не проводилась",
+            "inn": "ИНН соответствует",
+            "courts": "Сведения не найдены.",
+            "comment": "Без замечаний",
+            "conclusion": "СОГЛАСОВАНО",
+        }
+        person = {
+            "surname": " иванов ",
+            "firstname": "иван",
+            "patronymic": "иванович",
+            "birthday": "1985-04-12",
+            "citizenship": "Россия",
+            "inn": "770123456789",
+        }
+        anketa = json.dumps(make_anketa(random.Random(1)), ensure_ascii=False).encode()
+        cases = [
+            (
+                "check",
+                lambda: Check(**check).dict(),
+                lambda: Check.model_validate(check).model_dump(),
+            ),
+            (
+                "person",
+                lambda: Person(**person).dict(),
+                lambda: Person.model_validate(person).model_dump(),
+            ),
+            (
+                "anketa",
+                lambda: AnketaSchemaJson(**json.loads(anketa)).dict(),
+                lambda: AnketaSchemaJson.model_validate_json(anketa).model_dump(),
+            ),
+        ]
+        print(f"{'schema':<10}{'v1 style, /s':>14}{'v2, /s':>12}{'gain':>8}")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for name, legacy, native in cases:
+                rates = []
+                for validate in (legacy, native):
+                    start = time.perf_counter()
+                    for _ in range(rounds):
+                        validate()
+                    rates.append(rounds / (time.perf_counter() - start))
+                print(
+                    f"{name:<10}{rates[0]:>14.0f}{rates[1]:>12.0f}"
+                    f"{rates[1] / rates[0]:>7.2f}x"
+                )
+
+
+def session_cookie(app, role="user"):
+    from app.classes.classes import Regions
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    user = {"id": 1, "fullname": "Администратор", "role": role, "region": Regions.main.value}
+    return "session=" + serializer.dumps({"user": user})
+
+
+def start_server(workers, threads):
+    """
+    Start server.py on a free port with the database of open_app and wait
+    until it answers. Returns the process and the port.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--threads",
+            str(threads),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/auth").close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return server, port
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def bench_serve(duration="5", concurrency="16", threads="4", rows="20"):
+    """
+    Measure throughput of server.py for 1, 2 and 4 worker processes.
+
+    `concurrency` client threads post the persons list search for `duration`
+    seconds against a server started on a free port.
+    """
+    duration, concurrency = float(duration), int(concurrency)
+    threads, rows = int(threads), int(rows)
+    with tempfile.TemporaryDirectory() as workdir:
+        app = open_app(workdir)
+        for _ in range(rows):
+            seed_dossier(5)
+        cookie = session_cookie(app)
+
+        print(f"{'workers':<10}{'threads':>8}{'requests':>10}{'req/s':>10}{'errors':>8}")
+        for workers in (1, 2, 4):
+            server, port = start_server(workers, threads)
+            url = f"http://127.0.0.1:{port}/index/1"
+            counts = {"ok": 0, "errors": 0}
+            lock = threading.Lock()
+            deadline = time.perf_counter() + duration
+
+            def client():
+                while time.perf_counter() < deadline:
+                    request = urllib.request.Request(
+                        url, data=b"search=", headers={"Cookie": cookie}
+                    )
+                    try:
+                        urllib.request.urlopen(request, timeout=10).read()
+                        key = "ok"
+                    except OSError:
+                        key = "errors"
+                    with lock:
+                        counts[key] += 1
+
+            clients = [threading.Thread(target=client) for _ in range(concurrency)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            stop_server(server)
+            print(
+                f"{workers:<10}{threads:>8}{counts['ok']:>10}"
+                f"{counts['ok'] / duration:>10.1f}{counts['errors']:>8}"
+            )
+
+
+BROWSER_STUB = """
+import os, sys, time, urllib.request
+time.sleep(float(os.environ["BENCH_BROWSER_DELAY"]))
+try:
+    urllib.request.urlopen(sys.argv[1] + "/auth").read()
+    print("tti", time.time() - float(os.environ["BENCH_STARTED"]), flush=True)
+except OSError as e:
+    print("error", e, flush=True)
+"""
+
+
+def desktop_child(workdir, mode):
+    from app import create_app, warmup_templates
+    from webgui import FlaskUI, get_free_port
+
+    app = create_app(make_config(workdir, TEMPLATES_WARMUP=mode == "boot"))
+    port = get_free_port()
+    FlaskUI(
+        server_kwargs={"app": app, "host": "127.0.0.1", "port": port},
+        browser_command=[
+            sys.executable, "-c", BROWSER_STUB, f"http://127.0.0.1:{port}"
+        ],
+        on_ready=(lambda: warmup_templates(app)) if mode == "overlap" else None,
+    ).run()
+
+
+def bench_desktop(browser_delay=0.5):
+    """
+    Measure time to interactive of the desktop launcher.
+
+    The browser is replaced by a script that sleeps `browser_delay` seconds,
+    the typical start of a Chrome window, then loads the login page once
+    without retrying. Time is counted from the start of the process. A
+    priming run creates the database and the template bytecode cache first.
+
+    Modes:
+        boot:    templates are compiled in create_app before the server starts.
+        overlap: templates are compiled by on_ready while the browser starts.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        env = os.environ | {
+            "DATABASE_URI": "sqlite:///" + os.path.join(workdir, "bench.db"),
+            "BENCH_BROWSER_DELAY": str(browser_delay),
+        }
+        print(f"{'mode':<10}{'ready, ms':>12}{'tti, ms':>12}")
+        for mode in ("prime", "boot", "overlap"):
+            started = time.time()
+            env["BENCH_STARTED"] = str(started)
+            child = subprocess.Popen(
+                [sys.executable, __file__, "desktop-child", workdir, mode],
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+            ready = tti = "-"
+            for line in child.stdout:
+                if line.startswith("Server ready in"):
+                    ready = f"{(time.time() - started) * 1000:.0f}"
+                elif line.startswith("tti"):
+                    tti = f"{float(line.split()[1]) * 1000:.0f}"
+                    break
+                elif line.startswith("error"):
+                    tti = "error"
+                    break
+            child.kill()
+            child.wait()
+            if mode == "prime":
+                continue
+            print(f"{mode:<10}{ready:>12}{tti:>12}")
+
+
+METRIC_LINE = re.compile(
+    r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*",?)*\})?'
+    r" (-?[0-9.e+-]+|\+Inf|NaN)$"
+)
+
+
+def validate_metrics(text):
+    """
+    Check a Prometheus text exposition: every sample is well formed and
+    declared by a TYPE line, and histogram buckets are cumulative and end
+    with +Inf equal to _count. Returns the samples keyed by line prefix.
+    """
+    types = {}
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ", 3)
+            types[name] = kind
+            continue
+        if line.startswith("#") or not line:
+            continue
+        match = METRIC_LINE.match(line)
+        assert match, f"malformed line: {line}"
+        name = match.group(1)
+        base = re.sub(r"_(bucket|sum|count)$", "", name)
+        assert name in types or base in types, f"undeclared metric: {line}"
+        samples[line.rsplit(" ", 1)[0]] = float(match.group(3))
+
+    for name, kind in types.items():
+        if kind != "histogram":
+            continue
+        series = {}
+        for key, value in samples.items():
+            if key.startswith(name + "_bucket{"):
+                labels = re.sub(r',?le="[^"]*"', "", key[len(name + "_bucket") :])
+                series.setdefault(labels, []).append(value)
+        for labels, buckets in series.items():
+            assert buckets == sorted(buckets), f"buckets not cumulative: {labels}"
+            count = samples[name + "_count" + (labels if labels != "{}" else "")]
+            assert buckets[-1] == count, f"+Inf differs from _count: {labels}"
+    return samples
+
+
+def bench_scrape(requests="200"):
+    """
+    Scrape /metrics after a mix of requests and validate the output.
+
+    Also measures the collector overhead per request by comparing the mix
+    with metrics switched on and off.
+    """
+    requests = int(requests)
+    with tempfile.TemporaryDirectory() as workdir:
+        timings = {}
+        person_id = None
+        for enabled in (False, True):
+            app = open_app(workdir, METRICS=enabled)
+            person_id = person_id or seed_dossier(10)
+            client = app.test_client()
+            login(client)
+            start = time.perf_counter()
+            for i in range(requests):
+                if i % 4 == 0:
+                    client.get(f"/profile/{person_id}").get_data()
+                elif i % 4 == 1:
+                    client.post("/index/1").get_data()
+                elif i % 4 == 2:
+                    client.get(f"/checks/divs/{person_id}")
+                else:
+                    upload = (io.BytesIO(b"x" * 1000), "report.txt")
+                    client.post(
+                        f"/file/checks/{person_id}",
+                        data={f"checks-file-{person_id}": upload},
+                    )
+            timings[enabled] = (time.perf_counter() - start) / requests
+
+        assert client.get("/metrics").status_code == 401
+        login(client, "admin")
+        response = client.get("/metrics")
+        assert response.status_code == 200, response.status_code
+        samples = validate_metrics(response.get_data(as_text=True))
+
+        def basic(password):
+            token = base64.b64encode(f"superadmin:{password}".encode()).decode()
+            return {"Authorization": "Basic " + token}
+
+        # the default password must be changed before it opens /metrics
+        client = app.test_client()
+        default = app.config["DEFAULT_PASSWORD"]
+        assert client.get("/metrics", headers=basic(default)).status_code == 401
+        client.post(
+            "/auth/password",
+            data={"login": "superadmin", "password": default, "new_pswd": "Bench2024"},
+        )
+        assert client.get("/metrics", headers=basic("Bench2024")).status_code == 200
+
+        print(f"{len(samples)} samples valid")
+        for key, value in samples.items():
+            if "_bucket" not in key:
+                print(f"  {key} {value:g}")
+        print(
+            f"per request: {timings[False] * 1000:.2f} ms without metrics, "
+            f"{timings[True] * 1000:.2f} ms with metrics"
+        )
+
+
+OPERATOR_MIX = {
+    "search": 40,
+    "profile": 35,
+    "check": 10,
+    "upload": 5,
+    "login": 10,
+}
+SEARCHES = ["ИВАНОВ", "ПЕТРОВА ЕЛЕНА", "СМИРНОВ", "КОЗЛОВ ИВАН", "ОРЛОВА", "ВОЛК"]
+
+
+def multipart(name, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def percentile(timings, share):
+    return timings[min(int(len(timings) * share), len(timings) - 1)]
+
+
+def bench_load(concurrency="8", duration="20", workers="2", threads="8", persons="1000"):
+    """
+    Replay an operator mix against server.py and report latency per action.
+
+    Every simulated operator logs in with its own session, then repeatedly
+    picks an action by OPERATOR_MIX: search the persons list, open a profile,
+    save a check, upload a document or log in again. Failed requests and
+    'database is locked' errors reported by /metrics are counted separately.
+    """
+    from seed import seed
+
+    concurrency, duration = int(concurrency), float(duration)
+    with tempfile.TemporaryDirectory() as workdir:
+        app = open_app(workdir)
+        ids = seed(app, int(persons), random.Random(1))
+
+        from sqlalchemy import select
+
+        from app.classes.classes import Roles
+        from app.model.tables import Users, db_session
+
+        operators = db_session.scalars(
+            select(Users.username).where(Users.role == Roles.user.value)
+        ).all()
+        db_session.remove()
+
+        server, port = start_server(int(workers), int(threads))
+        base = f"http://127.0.0.1:{port}"
+        timings = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+
+        def operator(number):
+            rng = random.Random(number)
+            opener = urllib.request.build_opener(
+                urllib.request.HTTPCookieProcessor(CookieJar())
+            )
+            login_form = urllib.parse.urlencode(
+                {"login": operators[number % len(operators)], "password": "8" * 8}
+            ).encode()
+            action = "login"
+            while time.perf_counter() < deadline:
+                person_id = rng.choice(ids)
+                headers = {}
+                if action == "login":
+                    url, data = f"{base}/auth/login", login_form
+                elif action == "search":
+                    url = f"{base}/index/{rng.randint(1, 3)}"
+                    data = urllib.parse.urlencode({"search": rng.choice(SEARCHES)})
+                    data = data.encode()
+                elif action == "profile":
+                    url, data = f"{base}/profile/{person_id}", None
+                elif action == "check":
+                    url = f"{base}/checks/{person_id}"
+                    data = urllib.parse.urlencode(
+                        {"courts": "Сведения не найдены.", "conclusion": "СОГЛАСОВАНО"}
+                    ).encode()
+                else:
+                    url = f"{base}/file/checks/{person_id}"
+                    data, headers["Content-Type"] = multipart(
+                        f"checks-file-{person_id}",
+                        f"{uuid.uuid4().hex}.pdf",
+                        os.urandom(rng.randint(16, 256) * 1024),
+                    )
+                start = time.perf_counter()
+                try:
+                    request = urllib.request.Request(url, data=data, headers=headers)
+                    with opener.open(request, timeout=30) as response:
+                        response.read()
+                    failed = False
+                except OSError:
+                    failed = True
+                elapsed = time.perf_counter() - start
+                with lock:
+                    timings[action].append(elapsed)
+                    errors[action] += failed
+                action = rng.choices(
+                    list(OPERATOR_MIX), weights=list(OPERATOR_MIX.values())
+                )[0]
+
+        deadline = time.perf_counter() + duration
+        clients = [
+            threading.Thread(target=operator, args=(number,))
+            for number in range(concurrency)
+        ]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+
+        # the default password must be changed before it opens /metrics
+        urllib.request.urlopen(
+            f"{base}/auth/password",
+            data=urllib.parse.urlencode(
+                {
+                    "login": "superadmin",
+                    "password": app.config["DEFAULT_PASSWORD"],
+                    "new_pswd": "Bench2024",
+                }
+            ).encode(),
+        ).read()
+        token = base64.b64encode(b"superadmin:Bench2024")
+        metrics = urllib.request.urlopen(
+            urllib.request.Request(
+                f"{base}/metrics", headers={"Authorization": "Basic " + token.decode()}
+            )
+        ).read()
+        locked = validate_metrics(metrics.decode()).get("staffsec_sqlite_locked_total", 0)
+        stop_server(server)
+
+    total = sum(len(values) for values in timings.values())
+    print(
+        f"{concurrency} operators, {workers} workers x {threads} threads, "
+        f"{persons} persons, {duration:g} s"
+    )
+    print(
+        f"{'action':<10}{'requests':>10}{'req/s':>8}{'p50, ms':>10}"
+        f"{'p95, ms':>10}{'p99, ms':>10}{'errors':>8}"
+    )
+    for action in OPERATOR_MIX:
+        values = sorted(timings[action])
+        if not values:
+            continue
+        print(
+            f"{action:<10}{len(values):>10}{len(values) / duration:>8.1f}"
+            f"{percentile(values, 0.5) * 1000:>10.1f}"
+            f"{percentile(values, 0.95) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}{errors[action]:>8}"
+        )
+    print(f"total {total / duration:.1f} req/s, sqlite locked errors {locked:g}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def bench_suite(persons="2000", output=None, repeat="30"):
+    """
+    Time the main pages on a seeded database through the Flask test client.
+
+    Every case runs once to warm up and then `repeat` times. The results are
+    written as JSON to OUTPUT, by default bench-results/<commit>.json, for
+    'python bench.py compare'.
+    """
+    from seed import make_anketa, seed
+
+    repeat = int(repeat)
+    with tempfile.TemporaryDirectory() as workdir:
+        app = open_app(workdir)
+        rng = random.Random(1)
+        start = time.perf_counter()
+        ids = seed(app, int(persons), rng)
+        seeded = time.perf_counter() - start
+
+        from sqlalchemy import select
+
+        from app.model.tables import Persons, db_session
+
+        with_photo = db_session.scalars(
+            select(Persons.id).where(Persons.destination.is_not(None)).limit(repeat)
+        ).all()
+        db_session.remove()
+
+        client = app.test_client()
+        login(client)
+        person_ids = iter(rng.choice(ids) for _ in range(10_000))
+        photos = iter(with_photo * 10_000)
+
+        def anketa():
+            upload = json.dumps(make_anketa(rng), ensure_ascii=False).encode()
+            return client.post(
+                "/file/anketa/0", data={"json": (io.BytesIO(upload), "anketa.json")}
+            )
+
+        cases = {
+            "personal_first_page": lambda: client.post("/index/1"),
+            "personal_page_20": lambda: client.post("/index/20"),
+            "personal_search_surname": lambda: client.post(
+                "/index/1", data={"search": "ИВАНОВ"}
+            ),
+            "personal_search_full": lambda: client.post(
+                "/index/1", data={"search": "ИВАНОВА ЕЛЕНА 01.01.1980"}
+            ),
+            "profile": lambda: client.get(f"/profile/{next(person_ids)}"),
+            "anketa_import": anketa,
+            "info_get": lambda: client.get("/information"),
+            "info_post": lambda: client.post(
+                "/information",
+                data={"start": "2000-01-01", "end": "2100-01-01", "region": "РЦ Юг"},
+            ),
+            "image": lambda: client.get(f"/image/{next(photos)}"),
+        }
+
+        results = {}
+        for name, case in cases.items():
+            case().get_data()
+            timings = []
+            size = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = case()
+                size = len(response.get_data())
+                timings.append(time.perf_counter() - start)
+                assert response.status_code == 200, (name, response.status_code)
+            timings.sort()
+            results[name] = {
+                "median_ms": round(timings[len(timings) // 2] * 1000, 3),
+                "p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 3),
+                "min_ms": round(timings[0] * 1000, 3),
+                "bytes": size,
+            }
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "persons": int(persons),
+        "seed_s": round(seeded, 2),
+        "repeat": repeat,
+        "results": results,
+    }
+    if output is None:
+        os.makedirs("bench-results", exist_ok=True)
+        output = os.path.join("bench-results", f"{commit}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{persons} persons seeded in {seeded:.1f} s, commit {commit}")
+    print(f"{'case':<26}{'median, ms':>12}{'p95, ms':>10}{'bytes':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<26}{result['median_ms']:>12.2f}{result['p95_ms']:>10.2f}"
+            f"{result['bytes']:>10}"
+        )
+    print(f"Saved to {output}")
+
+
+def bench_compare(baseline, result):
+    """
+    Print the median and p95 of two suite results side by side.
+    """
+    with open(baseline, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(result, encoding="utf-8") as f:
+        after = json.load(f)
+    print(f"{before['commit']} -> {after['commit']}")
+    print(f"{'case':<26}{'median, ms':>22}{'change':>9}{'p95, ms':>22}")
+    for name, old in before["results"].items():
+        new = after["results"].get(name)
+        if not new:
+            print(f"{name:<26}{'missing':>22}")
+            continue
+        change = (new["median_ms"] / old["median_ms"] - 1) * 100
+        print(
+            f"{name:<26}{old['median_ms']:>10.2f} -> {new['median_ms']:>8.2f}"
+            f"{change:>+8.0f}%{old['p95_ms']:>10.2f} -> {new['p95_ms']:>8.2f}"
+        )
+
+
+benchmarks = {
+    "templates": bench_templates,
+    "stream": bench_stream,
+    "compress": bench_compress,
+    "validation": bench_validation,
+    "serve": bench_serve,
+    "desktop": bench_desktop,
+    "scrape": bench_scrape,
+    "suite": bench_suite,
+    "compare": bench_compare,
+    "load": bench_load,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "templates-child":
+        templates_child(*sys.argv[2:4])
+    elif len(sys.argv) > 1 and sys.argv[1] == "desktop-child":
+        desktop_child(*sys.argv[2:4])
+    elif len(sys.argv) > 1 and sys.argv[1] in benchmarks:
+        benchmarks[sys.argv[1]](*sys.argv[2:])
+    else:
+        print("Usage: python bench.py [{}]".format("|".join(benchmarks)))
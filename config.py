@@ -7,4 +7,33 @@ class Config:
     SECRET_KEY = "SUPERSECRETKEY"
     BASE_PATH = os.path.join(basedir, "..", "PersonalDB")
     DEFAULT_PASSWORD = "8" * 8
-    DATABASE_URI = os.path.join("sqlite:///", "..", "database.db")
+    DATABASE_URI = os.environ.get(
+        "DATABASE_URI", os.path.join("sqlite:///", "..", "database.db")
+    )
+    TEMPLATES_CACHE = os.path.join(basedir, "..", "TemplatesCache")
+    TEMPLATES_WARMUP = True
+    SERVER_TIMING = True
+    SLOW_QUERY_MS = 100
+    NAMES_TRANSLIT = False
+    QUERY_CHECKS = None
+    QUERY_BUDGET = 40
+    QUERY_REPEAT_LIMIT = 5
+    METRICS = True
+    METRICS_DIR = None
+    RELATIONS_GRAPH_DEPTH = 3
+    SSE_POLL_INTERVAL = 0.5
+    SSE_HEARTBEAT = 15
+    SSE_TIMEOUT = 30
+    SSE_MAX_STREAMS = None
+    COMPRESS_ALGORITHMS = ["br", "gzip", "deflate"]
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_LEVEL = 4
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_MIMETYPES = [
+        "text/html",
+        "text/css",
+        "text/javascript",
+        "application/javascript",
+        "application/json",
+        "image/svg+xml",
+    ]
@@ -0,0 +1,230 @@
+"""
+Offline search for persons entered more than once.
+
+Persons are grouped by blocking keys: the birthday, the INN, the SNILS and
+the first letters of the transliterated surname (current or previous) with
+the first name initial and either the year or the day and month of birth,
+so a single mistake in the birthday still leaves the pair in one block.
+Only pairs that share a block are compared, so the work grows with the
+number of persons rather than with its square.
+
+Pairs that score above the threshold are printed; with --apply they are
+saved as "Одно лицо" relations of the newer person for an operator to
+review on the relations tab:
+
+    python dedupe.py
+    python dedupe.py --threshold 0.9 --apply
+"""
+
+import argparse
+import sys
+from collections import defaultdict
+from difflib import SequenceMatcher
+from itertools import combinations
+
+from sqlalchemy import select
+
+PREFIX = 4
+MAX_BLOCK = 500
+
+
+def load_persons():
+    """
+    Read the fields used for matching of every person.
+
+    Returns:
+        dict: Records with transliterated names keyed by the person ID.
+    """
+    from app.model.names import normalize_name
+    from app.model.tables import Persons, Previous, db_session
+
+    persons = {}
+    for row in db_session.execute(
+        select(
+            Persons.id,
+            Persons.surname,
+            Persons.firstname,
+            Persons.patronymic,
+            Persons.birthday,
+            Persons.inn,
+            Persons.snils,
+        )
+    ):
+        persons[row.id] = {
+            "id": row.id,
+            "name": f"{row.surname} {row.firstname} {row.patronymic or ''}".strip(),
+            "surnames": {normalize_name(row.surname, translit=True) or ""},
+            "firstname": normalize_name(row.firstname, translit=True) or "",
+            "patronymic": normalize_name(row.patronymic, translit=True),
+            "birthday": row.birthday.isoformat() if row.birthday else None,
+            "inn": (row.inn or "").strip() or None,
+            "snils": "".join(ch for ch in row.snils or "" if ch.isdigit()) or None,
+        }
+    for person_id, surname in db_session.execute(
+        select(Previous.person_id, Previous.surname)
+    ):
+        if person_id in persons and surname:
+            persons[person_id]["surnames"].add(normalize_name(surname, translit=True))
+    return persons
+
+
+def blocking_keys(person):
+    if person["birthday"]:
+        yield "birthday", person["birthday"]
+    if person["inn"]:
+        yield "inn", person["inn"]
+    if person["snils"]:
+        yield "snils", person["snils"]
+    birthday = person["birthday"] or ""
+    for surname in person["surnames"]:
+        if surname:
+            name = surname[:PREFIX], person["firstname"][:1]
+            yield "name", *name, birthday[:4]
+            yield "name", *name, birthday[5:]
+
+
+def similarity(first, second):
+    if not first or not second:
+        return 0.0
+    return SequenceMatcher(None, first, second).ratio()
+
+
+def birthday_similarity(first, second):
+    if not first or not second:
+        return 0.0
+    if first == second:
+        return 1.0
+    swapped = f"{second[:4]}-{second[8:10]}-{second[5:7]}"
+    if first == swapped:
+        return 0.5
+    if sum(a != b for a, b in zip(first, second)) == 1:
+        return 0.5
+    return 0.0
+
+
+def score_pair(first, second):
+    """
+    Estimate how likely two records describe the same person.
+
+    Args:
+        first (dict): A record of load_persons.
+        second (dict): Another record.
+
+    Returns:
+        float: A score from 0 to 1. An equal INN or SNILS scores at least 0.95.
+    """
+    surname = max(
+        similarity(a, b) for a in first["surnames"] for b in second["surnames"]
+    )
+    if first["patronymic"] and second["patronymic"]:
+        patronymic = similarity(first["patronymic"], second["patronymic"])
+    else:
+        patronymic = 0.5
+    name = (
+        0.5 * surname
+        + 0.35 * similarity(first["firstname"], second["firstname"])
+        + 0.15 * patronymic
+    )
+    score = 0.7 * name + 0.3 * birthday_similarity(
+        first["birthday"], second["birthday"]
+    )
+    for key in ("inn", "snils"):
+        if first[key] and first[key] == second[key]:
+            score = max(score, 0.95)
+    return score
+
+
+def find_duplicates(persons, threshold=0.85):
+    """
+    Score every pair of persons that share a blocking key.
+
+    Blocks larger than MAX_BLOCK, such as a placeholder INN entered for many
+    persons, carry no information and are skipped.
+
+    Args:
+        persons (dict): Records of load_persons keyed by ID.
+        threshold (float): The lowest score of a reported pair.
+
+    Returns:
+        list: (score, older ID, newer ID) tuples, best matches first.
+    """
+    blocks = defaultdict(list)
+    for person in persons.values():
+        for key in set(blocking_keys(person)):
+            blocks[key].append(person["id"])
+    pairs = set()
+    for key, ids in blocks.items():
+        if len(ids) <= MAX_BLOCK:
+            pairs.update(combinations(sorted(ids), 2))
+        else:
+            print(f"Skipped block {key} of {len(ids)} persons", file=sys.stderr)
+    result = []
+    for first, second in pairs:
+        score = score_pair(persons[first], persons[second])
+        if score >= threshold:
+            result.append((score, first, second))
+    return sorted(result, reverse=True)
+
+
+def propose_relations(duplicates, username):
+    """
+    Save new duplicate pairs as "Одно лицо" relations of the newer person.
+
+    Pairs that already have a relation in either direction are left out.
+
+    Args:
+        duplicates (list): Tuples returned by find_duplicates.
+        username (str): The user the relations are recorded for.
+
+    Returns:
+        int: The number of relations added.
+    """
+    from app.classes.classes import Relations as RelationTypes
+    from app.model.tables import Relations, Users, db_session
+
+    user_id = db_session.scalar(select(Users.id).where(Users.username == username))
+    if user_id is None:
+        raise SystemExit(f"User {username} not found")
+    related = {
+        frozenset(row)
+        for row in db_session.execute(
+            select(Relations.person_id, Relations.relation_id)
+        )
+    }
+    added = 0
+    for _, older, newer in duplicates:
+        if frozenset((older, newer)) in related:
+            continue
+        db_session.add(
+            Relations(
+                relation=RelationTypes.similar.value,
+                relation_id=older,
+                person_id=newer,
+                user_id=user_id,
+            )
+        )
+        related.add(frozenset((older, newer)))
+        added += 1
+    db_session.commit()
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find persons entered twice.")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument(
+        "--apply", action="store_true", help="save the pairs as relations"
+    )
+    parser.add_argument("--user", default="superadmin", help="author of relations")
+    args = parser.parse_args()
+
+    persons = load_persons()
+    duplicates = find_duplicates(persons, args.threshold)
+    for score, older, newer in duplicates:
+        print(
+            f"{score:.2f}  {older:>7} {persons[older]['name']}"
+            f"  <->  {newer:>7} {persons[newer]['name']}"
+        )
+    print(f"{len(duplicates)} pairs among {len(persons)} persons")
+    if args.apply:
+        print(f"{propose_relations(duplicates, args.user)} relations added")
@@ -1,11 +1,20 @@
-from app import create_app
+from app import create_app, warmup_templates
+from config import Config
 from webgui import FlaskUI
 
 
+class DesktopConfig(Config):
+    # Templates are compiled by FlaskUI while the browser window opens.
+    TEMPLATES_WARMUP = False
+
+
 def main():
-    app = create_app()
-    FlaskUI(server_kwargs={"app": app, "host": "127.0.0.1", "port": 5000}).run()
+    app = create_app(DesktopConfig)
+    FlaskUI(
+        server_kwargs={"app": app, "host": "127.0.0.1", "port": 5000},
+        on_ready=lambda: warmup_templates(app),
+    ).run()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
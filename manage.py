@@ -0,0 +1,68 @@
+"""
+Maintenance commands for the database configured by DATABASE_URI.
+
+    python manage.py names          fill missing normalized names
+    python manage.py names --full   recompute all of them, after NAMES_TRANSLIT
+                                    is changed
+    python manage.py organizations  rebuild the organizations index
+    python manage.py fts            rebuild the full-text index of dossiers
+    python manage.py counters       recount the dashboard counters
+    python manage.py conclusions    fill the latest check of persons missing it
+    python manage.py conclusions --full
+                                    recompute it for every person
+"""
+
+import argparse
+
+
+def command_names(args):
+    from app.model.tables import backfill_names
+
+    print(f"{backfill_names(full=args.full)} rows updated")
+
+
+def command_organizations(args):
+    from app.model.tables import rebuild_organizations
+
+    print(f"{rebuild_organizations()} organization links indexed")
+
+
+def command_fts(args):
+    from app.model.search import rebuild_search_index
+
+    print(f"{rebuild_search_index()} fields indexed")
+
+
+def command_counters(args):
+    from app.model.tables import rebuild_counters
+
+    print(f"{rebuild_counters()} counters recounted")
+
+
+def command_conclusions(args):
+    from app.model.tables import backfill_last_checks
+
+    print(f"{backfill_last_checks(full=args.full)} persons updated")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="StaffSec maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    names = commands.add_parser("names", help="fill normalized name columns")
+    names.add_argument("--full", action="store_true", help="recompute every row")
+    names.set_defaults(handler=command_names)
+    organizations = commands.add_parser(
+        "organizations", help="rebuild the organizations index"
+    )
+    organizations.set_defaults(handler=command_organizations)
+    fts = commands.add_parser("fts", help="rebuild the full-text index")
+    fts.set_defaults(handler=command_fts)
+    counters = commands.add_parser("counters", help="recount the dashboard counters")
+    counters.set_defaults(handler=command_counters)
+    conclusions = commands.add_parser(
+        "conclusions", help="fill the latest check conclusion of persons"
+    )
+    conclusions.add_argument("--full", action="store_true")
+    conclusions.set_defaults(handler=command_conclusions)
+    args = parser.parse_args()
+    args.handler(args)
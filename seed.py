@@ -0,0 +1,445 @@
+"""
+Synthetic data for benchmarks and manual testing.
+
+Fills the database configured by DATABASE_URI with persons that have child
+rows in every table of tables_models, operators in every region and upload
+folders with photos and check documents:
+
+    python seed.py 5000
+    python seed.py 5000 42
+
+The second argument is the random seed, the same seed produces the same
+data. Never run it against a working database.
+"""
+
+import io
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+from PIL import Image
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+SURNAMES = (
+    ["ИВАНОВ", "СМИРНОВ", "КУЗНЕЦОВ", "ПОПОВ", "ВАСИЛЬЕВ", "ПЕТРОВ", "СОКОЛОВ"]
+    + ["МИХАЙЛОВ", "НОВИКОВ", "ФЁДОРОВ", "МОРОЗОВ", "ВОЛКОВ", "АЛЕКСЕЕВ", "ЛЕБЕДЕВ"]
+    + ["СЕМЁНОВ", "ЕГОРОВ", "ПАВЛОВ", "КОЗЛОВ", "СТЕПАНОВ", "НИКОЛАЕВ", "ОРЛОВ"]
+    + ["АНДРЕЕВ", "МАКАРОВ", "НИКИТИН", "ЗАХАРОВ", "ЗАЙЦЕВ", "СОЛОВЬЁВ", "БОРИСОВ"]
+)
+FIRSTNAMES = {
+    "male": ["АЛЕКСАНДР", "СЕРГЕЙ", "ДМИТРИЙ", "АНДРЕЙ", "АЛЕКСЕЙ", "МАКСИМ", "ИВАН"]
+    + ["ЕВГЕНИЙ", "МИХАИЛ", "АРТЁМ", "НИКОЛАЙ", "ПАВЕЛ", "ВЛАДИМИР", "ОЛЕГ"],
+    "female": ["ЕЛЕНА", "ОЛЬГА", "НАТАЛЬЯ", "ЕКАТЕРИНА", "АННА", "ТАТЬЯНА", "МАРИЯ"]
+    + ["ИРИНА", "СВЕТЛАНА", "ЮЛИЯ", "АНАСТАСИЯ", "ДАРЬЯ", "ЕЛИЗАВЕТА", "ВИКТОРИЯ"],
+}
+PATRONYMICS = ["АЛЕКСАНДРОВ", "СЕРГЕЕВ", "ДМИТРИЕВ", "АНДРЕЕВ", "ИВАНОВ", "ПАВЛОВ"]
+CITIES = ["г. Москва", "г. Санкт-Петербург", "г. Екатеринбург", "г. Новосибирск"]
+CITIES += ["г. Краснодар", "г. Ростов-на-Дону", "г. Владивосток", "г. Казань"]
+STREETS = ["ул. Ленина", "ул. Мира", "пр. Победы", "ул. Садовая", "ул. Лесная"]
+COMPANIES = ["ООО «Вектор»", "АО «Меридиан»", "ПАО «Сбербанк»", "ООО «Альфа»"]
+COMPANIES += ["ООО «Ромашка»", "АО «Гранит»", "ООО «Техносервис»", "ИП Сидоров"]
+POSITIONS = ["Специалист", "Ведущий специалист", "Менеджер", "Руководитель отдела"]
+POSITIONS += ["Аналитик", "Бухгалтер", "Кассир", "Инженер", "Юрист"]
+DEPARTMENTS = ["Отдел продаж", "Бухгалтерия", "ИТ-департамент", "Юридический отдел"]
+UNIVERSITIES = ["МГУ им. М.В. Ломоносова", "СПбГУ", "УрФУ", "НГУ", "КФУ", "РЭУ"]
+SPECIALTIES = ["Экономика", "Юриспруденция", "Прикладная информатика", "Финансы"]
+FINDINGS = [
+    "Сведения не найдены.",
+    "Информация подтверждена.",
+    "Имеются исполнительные производства на сумму {} руб.",
+    "Выявлены судебные дела по гражданским искам: {}.",
+    "Упоминания в открытых источниках носят нейтральный характер.",
+]
+
+# Mean number of rows per person and the share of persons having any
+CHILD_ROWS = {
+    "previous": (1, 0.1),
+    "educations": (1.6, 0.95),
+    "staffs": (1, 1.0),
+    "documents": (1.3, 1.0),
+    "addresses": (2, 1.0),
+    "contacts": (2, 1.0),
+    "relations": (1.2, 0.05),
+    "workplaces": (3, 0.9),
+    "affilations": (1.3, 0.15),
+    "checks": (1.2, 0.8),
+    "poligrafs": (1, 0.2),
+    "investigations": (1, 0.05),
+    "inquiries": (1.5, 0.15),
+}
+
+
+def digits(rng, count):
+    return "".join(rng.choice("0123456789") for _ in range(count))
+
+
+def random_date(rng, start, end):
+    return start + timedelta(days=rng.randrange(max((end - start).days, 1)))
+
+
+def random_name(rng):
+    gender = rng.choice(["male", "female"])
+    surname = rng.choice(SURNAMES)
+    patronymic = rng.choice(PATRONYMICS)
+    if gender == "female":
+        surname = surname + "А"
+        patronymic = patronymic + "НА"
+    else:
+        patronymic = patronymic + "ИЧ"
+    return surname, rng.choice(FIRSTNAMES[gender]), patronymic
+
+
+def random_address(rng):
+    return (
+        f"{rng.choice(CITIES)}, {rng.choice(STREETS)}, "
+        f"д. {rng.randint(1, 120)}, кв. {rng.randint(1, 300)}"
+    )
+
+
+def random_finding(rng):
+    return rng.choice(FINDINGS).format(rng.randint(1, 500) * 1000)
+
+
+def make_row(rng, item, person, now):
+    """Build one child row of `item` for the person as a dict of columns."""
+    from app.classes.classes import (
+        Addresses,
+        Affiliates,
+        Conclusions,
+        Contacts,
+        Documents,
+        Educations,
+        Poligrafs,
+        Relations,
+    )
+
+    created = random_date(rng, person["created"], now)
+    if item == "previous":
+        surname, firstname, patronymic = random_name(rng)
+        return {
+            "surname": surname,
+            "firstname": firstname,
+            "patronymic": patronymic,
+            "changed": str(rng.randint(2000, 2020)),
+            "reason": "Вступление в брак",
+        }
+    if item == "educations":
+        return {
+            "view": rng.choice(list(Educations)).value,
+            "institution": rng.choice(UNIVERSITIES),
+            "finished": rng.randint(1995, 2023),
+            "specialty": rng.choice(SPECIALTIES),
+        }
+    if item == "staffs":
+        return {
+            "position": rng.choice(POSITIONS),
+            "department": rng.choice(DEPARTMENTS),
+        }
+    if item == "documents":
+        return {
+            "view": rng.choice(list(Documents)).value,
+            "series": digits(rng, 4),
+            "digits": digits(rng, 6),
+            "agency": f"ГУ МВД России по {rng.choice(CITIES)}",
+            "issue": random_date(rng, date(2005, 1, 1), date(2023, 1, 1)),
+        }
+    if item == "addresses":
+        return {
+            "view": rng.choice(list(Addresses)).value,
+            "addresses": random_address(rng),
+        }
+    if item == "contacts":
+        view = rng.choice(list(Contacts))
+        contact = (
+            f"user{digits(rng, 5)}@mail.ru"
+            if view is Contacts.email
+            else "+79" + digits(rng, 9)
+        )
+        return {"view": view.value, "contact": contact}
+    if item == "relations":
+        return {
+            "relation": rng.choice(list(Relations)).value,
+            "relation_id": rng.randint(1, person["id"]),
+        }
+    if item == "workplaces":
+        starts = random_date(rng, date(2000, 1, 1), date(2022, 1, 1))
+        now_work = rng.random() < 0.3
+        return {
+            "now_work": now_work,
+            "starts": starts,
+            "finished": None if now_work else random_date(rng, starts, date(2024, 1, 1)),
+            "workplace": rng.choice(COMPANIES),
+            "addresses": random_address(rng),
+            "position": rng.choice(POSITIONS),
+            "reason": None if now_work else "По собственному желанию",
+        }
+    if item == "affilations":
+        return {
+            "view": rng.choice(list(Affiliates)).value,
+            "organization": rng.choice(COMPANIES),
+            "inn": digits(rng, 10),
+        }
+    if item == "checks":
+        row = {
+            field: random_finding(rng)
+            for field in (
+                "workplace",
+                "document",
+                "inn",
+                "debt",
+                "bankruptcy",
+                "bki",
+                "courts",
+                "affilation",
+                "terrorist",
+                "mvd",
+                "internet",
+                "cronos",
+                "cros",
+            )
+        }
+        conclusion = rng.choices(list(Conclusions), weights=[80, 12, 8])[0]
+        return row | {
+            "comment": random_finding(rng) if rng.random() < 0.3 else None,
+            "conclusion": conclusion.value,
+            "created": created,
+        }
+    if item == "poligrafs":
+        return {
+            "theme": rng.choice(list(Poligrafs)).value,
+            "results": "Признаков скрываемой информации не выявлено. "
+            + random_finding(rng),
+            "created": created,
+        }
+    if item == "investigations":
+        return {
+            "theme": "Служебное расследование",
+            "info": random_finding(rng) * 3,
+            "created": created,
+        }
+    if item == "inquiries":
+        return {
+            "info": "Запрос сведений о кандидате. " + random_finding(rng),
+            "initiator": rng.choice(DEPARTMENTS),
+            "origins": rng.choice(COMPANIES),
+            "created": created,
+        }
+    raise KeyError(item)
+
+
+def seed_users(rng):
+    """
+    Add two operators per region and return their ids and regions.
+    """
+    from app.classes.classes import Regions, Roles
+    from app.model.tables import Users, db_session
+
+    passhash = generate_password_hash("8" * 8)
+    users = []
+    for region in Regions:
+        for number in (1, 2):
+            surname, firstname, patronymic = random_name(rng)
+            user = db_session.execute(
+                select(Users).where(Users.username == f"{region.name}{number}")
+            ).scalar_one_or_none()
+            if not user:
+                user = Users(
+                    fullname=f"{surname} {firstname} {patronymic}".title(),
+                    username=f"{region.name}{number}",
+                    passhash=passhash,
+                    change_pswd=False,
+                    role=Roles.user.value,
+                    region=region.value,
+                )
+                db_session.add(user)
+                db_session.flush()
+            users.append((user.id, region.value))
+    db_session.commit()
+    return users
+
+
+def make_folders(rng, person, base_path):
+    """
+    Create the upload folder of a person like make_destination does, with a
+    photo and scanned check documents.
+    """
+    destination = os.path.join(
+        base_path,
+        person["region"],
+        person["surname"][0],
+        f"{person['id']}-{person['surname']} {person['firstname']} "
+        f"{person['patronymic']}",
+    )
+    os.makedirs(os.path.join(destination, "image"), exist_ok=True)
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new("RGB", (300, 400), color).save(
+        os.path.join(destination, "image", "image.jpg")
+    )
+    day = os.path.join(destination, "checks", person["created"].strftime("%Y-%m-%d"))
+    os.makedirs(day, exist_ok=True)
+    for number in range(rng.randint(1, 3)):
+        with open(os.path.join(day, f"document-{number}.pdf"), "wb") as f:
+            f.write(b"%PDF-1.4\n" + os.urandom(rng.randint(2, 64) * 1024))
+    return destination
+
+
+def seed(app, persons, rng=None, batch=500):
+    """
+    Add `persons` synthetic persons with child rows and upload folders.
+
+    Parameters:
+        app (Flask): The application, for BASE_PATH and the database.
+        persons (int): Number of persons to add.
+        rng (random.Random): Source of randomness, seeded for repeatable data.
+        batch (int): Persons inserted per transaction.
+
+    Returns:
+        list: Ids of the added persons.
+    """
+    from app.model.search import rebuild_search_index
+    from app.model.tables import (
+        Persons,
+        backfill_last_checks,
+        backfill_names,
+        db_session,
+        rebuild_counters,
+        rebuild_organizations,
+        tables_models,
+    )
+
+    rng = rng or random.Random(0)
+    users = seed_users(rng)
+    now = datetime.now()
+    first_id = (db_session.scalar(select(func.max(Persons.id))) or 0) + 1
+    ids = list(range(first_id, first_id + persons))
+
+    for start in range(0, persons, batch):
+        people = []
+        children = {item: [] for item in CHILD_ROWS}
+        for person_id in ids[start : start + batch]:
+            user_id, region = rng.choice(users)
+            surname, firstname, patronymic = random_name(rng)
+            created = now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60))
+            person = {
+                "id": person_id,
+                "surname": surname,
+                "firstname": firstname,
+                "patronymic": patronymic,
+                "birthday": random_date(rng, date(1960, 1, 1), date(2004, 1, 1)),
+                "birthplace": rng.choice(CITIES),
+                "citizenship": "Российская Федерация",
+                "snils": digits(rng, 11),
+                "inn": digits(rng, 12),
+                "marital": rng.choice(["Холост", "Женат", "Замужем", "Разведен"]),
+                "created": created,
+                "registered": created,
+                "region": region,
+                "isbusy": rng.random() < 0.1,
+                "user_id": user_id,
+                "destination": None,
+            }
+            if rng.random() < 0.3:
+                person["destination"] = make_folders(
+                    rng, person, app.config["BASE_PATH"]
+                )
+            people.append(person)
+            for item, (mean, share) in CHILD_ROWS.items():
+                if rng.random() >= share:
+                    continue
+                for _ in range(max(1, round(rng.expovariate(1 / mean)))):
+                    row = make_row(rng, item, person, now)
+                    row.setdefault("created", random_date(rng, person["created"], now))
+                    children[item].append(
+                        row | {"person_id": person_id, "user_id": user_id}
+                    )
+        db_session.execute(insert(Persons), people)
+        for item, rows in children.items():
+            if rows:
+                db_session.execute(insert(tables_models[item]), rows)
+        db_session.commit()
+    backfill_names()
+    backfill_last_checks()
+    rebuild_organizations()
+    rebuild_counters()
+    rebuild_search_index()
+    db_session.remove()
+    return ids
+
+
+def make_anketa(rng):
+    """
+    Build an anketa as uploaded from the candidate web form, in the JSON
+    layout read by AnketaSchemaJson.
+    """
+    surname, firstname, patronymic = random_name(rng)
+    birthday = random_date(rng, date(1960, 1, 1), date(2004, 1, 1))
+    return {
+        "lastName": surname.title(),
+        "firstName": firstname.title(),
+        "midName": patronymic.title(),
+        "birthday": birthday.isoformat(),
+        "birthplace": rng.choice(CITIES),
+        "citizen": "Российская Федерация",
+        "maritalStatus": "Холост",
+        "inn": digits(rng, 12),
+        "snils": digits(rng, 11),
+        "positionName": rng.choice(POSITIONS),
+        "department": rng.choice(DEPARTMENTS),
+        "passportSerial": digits(rng, 4),
+        "passportNumber": digits(rng, 6),
+        "passportIssueDate": random_date(rng, date(2010, 1, 1), date(2023, 1, 1))
+        .isoformat(),
+        "passportIssuedBy": f"ГУ МВД России по {rng.choice(CITIES)}",
+        "validAddress": random_address(rng),
+        "regAddress": random_address(rng),
+        "email": f"user{digits(rng, 5)}@mail.ru",
+        "contactPhone": "+79" + digits(rng, 9),
+        "education": [
+            {
+                "educationType": "Высшее",
+                "institutionName": rng.choice(UNIVERSITIES),
+                "endYear": rng.randint(1995, 2023),
+                "specialty": rng.choice(SPECIALTIES),
+            }
+        ],
+        "experience": [
+            {
+                "beginDate": random_date(rng, date(2005, 1, 1), date(2015, 1, 1))
+                .isoformat(),
+                "endDate": random_date(rng, date(2015, 1, 1), date(2023, 1, 1))
+                .isoformat(),
+                "name": rng.choice(COMPANIES),
+                "address": random_address(rng),
+                "position": rng.choice(POSITIONS),
+                "fireReason": "По собственному желанию",
+            }
+            for _ in range(rng.randint(1, 5))
+        ],
+        "nameWasChanged": [],
+        "organizations": [{"name": rng.choice(COMPANIES), "inn": digits(rng, 10)}],
+        "relatedPersonsOrganizations": [],
+        "stateOrganizations": [],
+        "publicOfficeOrganizations": [],
+    }
+
+
+def make_image(rng):
+    """A small JPEG photo as bytes."""
+    buffer = io.BytesIO()
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new("RGB", (300, 400), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not sys.argv[1].isdigit():
+        print("Usage: python seed.py PERSONS [SEED]")
+    else:
+        from app import create_app
+
+        app = create_app()
+        rng = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+        added = seed(app, int(sys.argv[1]), rng)
+        print(f"{len(added)} persons added, ids {added[0]}-{added[-1]}")
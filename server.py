@@ -1,9 +1,157 @@
+import argparse
+import os
+import shutil
+import signal
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
 from app import create_app
+from app.depends.events import broker
+from app.model.tables import db_session, engine
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server handling requests in a fixed pool of threads.
+
+    Shutting the server down stops accepting connections and waits for the
+    requests already in progress.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def get_request(self):
+        conn, client_address = super().get_request()
+        # Accepted sockets inherit the non-blocking mode of the listening one
+        # on Windows and BSD, request handlers expect blocking reads.
+        conn.setblocking(True)
+        return conn, client_address
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        self.pool.shutdown(wait=True)
+        super().server_close()
+
+
+def serve_until_signal(server):
+    """
+    Serve requests until SIGTERM or SIGINT, then end the event streams, finish
+    the requests in progress and return.
+    """
+
+    def stop(signum, frame):
+        broker.stop()
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.serve_forever()
+
+
+def run_worker(server):
+    """
+    Serve requests in a forked worker process.
+
+    Connections inherited from the parent process are dropped without closing,
+    so the worker opens its own SQLite connections.
+    """
+    engine.dispose(close=False)
+    db_session.remove()
+    serve_until_signal(server)
+    os._exit(0)
+
+
+def serve(app, host, port, workers, threads):
+    """
+    Run the application with a pre-fork model: the parent binds the socket and
+    supervises `workers` child processes, each serving with `threads` threads.
+
+    Workers that die are restarted. SIGTERM or SIGINT to the parent stops all
+    workers gracefully. On platforms without fork a single process is used.
+    Unless SSE_MAX_STREAMS is set, event streams may take up to half of the
+    threads of a worker, the other half is kept for regular requests.
+    """
+    if not app.config.get("SSE_MAX_STREAMS"):
+        app.config["SSE_MAX_STREAMS"] = max(1, threads // 2)
+    server = PooledWSGIServer(host, port, app, threads)
+    print(f"Serving on http://{host}:{port} ({workers} workers x {threads} threads)")
+    if workers < 2 or not hasattr(os, "fork"):
+        serve_until_signal(server)
+        return
+
+    # Forked workers share the listening socket and all wake up on a new
+    # connection; the ones losing the race must not block in accept().
+    server.socket.setblocking(False)
+    engine.dispose()
+    metrics_dir = None
+    if app.config.get("METRICS") and not app.config.get("METRICS_DIR"):
+        metrics_dir = app.config["METRICS_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(server)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            spawn()
+    server.socket.close()
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="StaffSec server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--debug", action="store_true", help="run the development server"
+    )
+    args = parser.parse_args()
+
     app = create_app()
-    app.run(host="127.0.0.1", port=5000, debug=True)
+    if args.debug:
+        app.run(host=args.host, port=args.port, debug=True)
+    else:
+        serve(app, args.host, args.port, args.workers, args.threads)
 
 
 if __name__ == "__main__":
@@ -4,21 +4,27 @@ import os
 import shutil
 import time
 import uuid
-import signal
 import tempfile
 import platform
 import subprocess
 import socketserver
-from multiprocessing import Process
 from threading import Thread
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, List, Union
+from typing import Any, Callable, Dict, List
 from contextlib import suppress
 
 import psutil
+from werkzeug.serving import BaseWSGIServer, make_server
 
-FLASKWEBGUI_USED_PORT = None
+FLASKWEBGUI_SERVER = None
 FLASKWEBGUI_BROWSER_PROCESS = None
+FLASKWEBGUI_BROWSER_CACHE = os.path.join(
+    os.environ.get("LOCALAPPDATA")
+    or os.environ.get("XDG_CACHE_HOME")
+    or os.path.join(os.path.expanduser("~"), ".cache"),
+    "flaskwebgui",
+    "browser",
+)
 
 OPERATING_SYSTEM = platform.system().lower()
 PY = "python3" if OPERATING_SYSTEM == "linux" else "python"
@@ -30,21 +36,26 @@ def get_free_port():
     return free_port
 
 
-def kill_port(port: int):
-    for proc in psutil.process_iter():
-        try:
-            for conns in proc.connections(kind="inet"):
-                if conns.laddr.port == port:
-                    proc.send_signal(signal.SIGTERM)
-        except psutil.AccessDenied:
-            continue
+def terminate_process_tree(process: subprocess.Popen, timeout: float = 3):
+    """Terminate a process started by the launcher together with its children."""
+    with suppress(psutil.NoSuchProcess):
+        parent = psutil.Process(process.pid)
+        procs = parent.children(recursive=True) + [parent]
+        for proc in procs:
+            with suppress(psutil.NoSuchProcess):
+                proc.terminate()
+        _, alive = psutil.wait_procs(procs, timeout=timeout)
+        for proc in alive:
+            with suppress(psutil.NoSuchProcess):
+                proc.kill()
 
 
 def close_application():
     if FLASKWEBGUI_BROWSER_PROCESS is not None:
-        FLASKWEBGUI_BROWSER_PROCESS.terminate()
+        terminate_process_tree(FLASKWEBGUI_BROWSER_PROCESS)
 
-    kill_port(FLASKWEBGUI_USED_PORT)
+    if FLASKWEBGUI_SERVER is not None:
+        FLASKWEBGUI_SERVER.shutdown()
 
 
 def find_browser_on_linux():
@@ -64,14 +75,9 @@ def find_browser_on_linux():
             return path
 
     for path in paths:
-        with suppress(subprocess.CalledProcessError):
-            bp = (
-                subprocess.check_output(["which", os.path.basename(path)])
-                .decode("utf-8")
-                .strip()
-            )
-            if os.path.exists(bp):
-                return bp
+        bp = shutil.which(os.path.basename(path))
+        if bp:
+            return bp
 
     return None
 
@@ -94,6 +100,46 @@ browser_path_dispacher: Dict[str, Callable[[], str]] = {
 }
 
 
+def is_private_file(path):
+    """Tell whether a file is owned by the current user and writable by no one else."""
+    if not hasattr(os, "getuid"):
+        return True
+    info = os.stat(path)
+    return info.st_uid == os.getuid() and not info.st_mode & 0o022
+
+
+def find_browser():
+    """
+    Resolve the browser path once and remember it between launches.
+
+    The path is executed, so it is cached in the user's own cache directory
+    and only trusted from a file no other user can write. The cached path is
+    checked for existence, so a removed browser is looked up again.
+    """
+    with suppress(OSError):
+        if is_private_file(FLASKWEBGUI_BROWSER_CACHE):
+            with open(FLASKWEBGUI_BROWSER_CACHE, encoding="utf-8") as f:
+                path = f.read().strip()
+            if os.path.exists(path):
+                return path
+
+    find = browser_path_dispacher.get(OPERATING_SYSTEM)
+    path = find() if find else None
+    if path:
+        with suppress(OSError):
+            os.makedirs(
+                os.path.dirname(FLASKWEBGUI_BROWSER_CACHE), 0o700, exist_ok=True
+            )
+            with suppress(FileNotFoundError):
+                os.remove(FLASKWEBGUI_BROWSER_CACHE)
+            fd = os.open(
+                FLASKWEBGUI_BROWSER_CACHE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600
+            )
+            with open(fd, "w", encoding="utf-8") as f:
+                f.write(path)
+    return path
+
+
 class ServerFlask:
     @staticmethod
     def get_server_kwargs(**kwargs):
@@ -101,14 +147,18 @@ class ServerFlask:
 
     @staticmethod
     def server(**server_kwargs):
-        app = server_kwargs.pop("app", None)
-        server_kwargs.pop("debug", None)
-        app.run(**server_kwargs)
+        """Bind a threaded WSGI server, the caller runs serve_forever."""
+        return make_server(
+            server_kwargs.get("host", "127.0.0.1"),
+            server_kwargs["port"],
+            server_kwargs["app"],
+            threaded=True,
+        )
 
 
 @dataclass
 class FlaskUI:
-    server: Callable[[Any], None] = None
+    server: Callable[..., BaseWSGIServer] = None
     server_kwargs: dict = None
     app: Any = None
     port: int = None
@@ -116,6 +166,7 @@ class FlaskUI:
     height: int = None
     fullscreen: bool = True
     on_startup: Callable = None
+    on_ready: Callable = None
     on_shutdown: Callable = None
     extra_flags: List[str] = None
     browser_path: str = None
@@ -124,16 +175,11 @@ class FlaskUI:
 
     def __post_init__(self):
         self.__keyboard_interrupt = False
-        global FLASKWEBGUI_USED_PORT
 
         if self.port is None:
-            self.port = (
-                self.server_kwargs.get("port")
-                if self.server_kwargs
-                else get_free_port()
-            )
-
-        FLASKWEBGUI_USED_PORT = self.port
+            self.port = (self.server_kwargs or {}).get("port") or get_free_port()
+        if self.server_kwargs is not None:
+            self.server_kwargs["port"] = self.port
 
         default_server = ServerFlask()
         self.server = default_server.server
@@ -144,14 +190,13 @@ class FlaskUI:
         )
         self.url = f"http://127.0.0.1:{self.port}"
 
-        self.browser_path = (
-            self.browser_path or browser_path_dispacher.get(OPERATING_SYSTEM)()
-        )
-        self.browser_command = self.browser_command or self.get_browser_command()
+        self.browser_path = self.browser_path or find_browser()
+        if self.browser_command is None:
+            self.browser_command = self.get_browser_command()
 
-        if not self.browser_path:
-            print("path to chrome not found")
-            self.browser_command = [PY, "-m", "webbrowser", "-n", self.url]
+            if not self.browser_path:
+                print("path to chrome not found")
+                self.browser_command = [PY, "-m", "webbrowser", "-n", self.url]
 
     def get_browser_command(self):
         flags = [
@@ -174,7 +219,7 @@ class FlaskUI:
 
         return flags
 
-    def start_browser(self, server_process: Union[Thread, Process]):
+    def start_browser(self, server: BaseWSGIServer):
         print("Command:", " ".join(self.browser_command))
         global FLASKWEBGUI_BROWSER_PROCESS
         FLASKWEBGUI_BROWSER_PROCESS = subprocess.Popen(self.browser_command)
@@ -184,31 +229,40 @@ class FlaskUI:
             while self.__keyboard_interrupt is False:
                 time.sleep(1)
 
-        if isinstance(server_process, Process):
-            if self.on_shutdown is not None:
-                self.on_shutdown()
-            shutil.rmtree(self.profile_dir, ignore_errors=True)
-            server_process.kill()
-        else:
-            if self.on_shutdown is not None:
-                self.on_shutdown()
-            shutil.rmtree(self.profile_dir, ignore_errors=True)
-            kill_port(self.port)
+        if self.on_shutdown is not None:
+            self.on_shutdown()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+        server.shutdown()
 
     def run(self):
+        """
+        Start the server, open the browser once the port is bound and wait
+        until the browser window is closed.
+
+        on_ready runs while the browser process starts, which is the place
+        for warm-up work that the first page benefits from.
+        """
+        started = time.perf_counter()
         if self.on_startup is not None:
             self.on_startup()
 
-        server_process = Thread(target=self.server, kwargs=self.server_kwargs or {})
-        browser_thread = Thread(target=self.start_browser, args=(server_process,))
+        global FLASKWEBGUI_SERVER
+        server = FLASKWEBGUI_SERVER = self.server(**(self.server_kwargs or {}))
+        server_process = Thread(target=server.serve_forever)
+        browser_thread = Thread(target=self.start_browser, args=(server,))
 
         try:
             server_process.start()
+            print(f"Server ready in {(time.perf_counter() - started) * 1000:.0f} ms")
             browser_thread.start()
+            if self.on_ready is not None:
+                self.on_ready()
             server_process.join()
             browser_thread.join()
         except KeyboardInterrupt:
             self.__keyboard_interrupt = True
+            if FLASKWEBGUI_BROWSER_PROCESS is not None:
+                terminate_process_tree(FLASKWEBGUI_BROWSER_PROCESS)
             print("Stopped")
 
         return server_process, browser_thread